@@ -0,0 +1,183 @@
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+
+import numpy as np
+from sqlalchemy import select, func, exists
+
+from measurement_archive import decode_block_arrays, FLOAT_COLUMNS, NULL_INT
+from models import Measurement, MeasurementBlock, Patient, PatientDiagnosis, Diagnosis, DoctorPatient, GenderEnum
+from sharding import fan_out, fan_out_rows
+
+METRICS = ('glucose', 'systolic_bp', 'diastolic_bp', 'pulse', 'weight')
+DEFAULT_PERCENTILES = (5, 25, 50, 75, 95)
+DEFAULT_PERIOD_DAYS = 90
+MAX_AGE = 150
+FETCH_CHUNK = 50000
+CACHE_SIZE = 256
+
+CohortFilter = namedtuple('CohortFilter', ['diagnosis_category', 'age_min', 'age_max', 'gender', 'date_from',
+                                           'date_to', 'metrics', 'percentiles', 'bins'])
+
+
+def _years_before(day, years):
+    try:
+        return day.replace(year=day.year - years)
+    except ValueError:
+        return day.replace(year=day.year - years, day=28)
+
+
+def parse_filter(args, today=None):
+    today = today or date.today()
+    date_to = date.fromisoformat(args['date_to']) if args.get('date_to') else today
+    date_from = date.fromisoformat(args['date_from']) if args.get('date_from') \
+        else date_to - timedelta(days=min(DEFAULT_PERIOD_DAYS, (date_to - date.min).days))
+    if date_from > date_to:
+        raise ValueError('date_from must not be after date_to')
+
+    gender = args.get('gender')
+    if gender is not None and gender not in {g.value for g in GenderEnum}:
+        raise ValueError('Unknown gender')
+
+    metrics = tuple(args['metrics'].split(',')) if args.get('metrics') else METRICS
+    if not metrics or any(m not in METRICS for m in metrics):
+        raise ValueError(f"metrics must be a subset of {', '.join(METRICS)}")
+
+    percentiles = tuple(float(p) for p in args['percentiles'].split(',')) if args.get('percentiles') \
+        else DEFAULT_PERCENTILES
+    # NaN не проходит ни одно сравнение, поэтому проверяем попадание в диапазон, а не выход за него
+    if any(not 0 <= p <= 100 for p in percentiles):
+        raise ValueError('percentiles must be between 0 and 100')
+
+    bins = int(args.get('bins', 20))
+    if not 1 <= bins <= 200:
+        raise ValueError('bins must be between 1 and 200')
+
+    age_min = int(args['age_min']) if args.get('age_min') else None
+    age_max = int(args['age_max']) if args.get('age_max') else None
+    if any(age is not None and not 0 <= age <= MAX_AGE for age in (age_min, age_max)):
+        raise ValueError(f'age_min and age_max must be between 0 and {MAX_AGE}')
+    if age_min is not None and age_max is not None and age_min > age_max:
+        raise ValueError('age_min must not be greater than age_max')
+    return CohortFilter(args.get('diagnosis_category'), age_min, age_max, gender, date_from, date_to, metrics,
+                        percentiles, bins)
+
+
+def _cohort_statement(stmt, patient_id_column, doctor_id, cohort, today):
+    stmt = stmt.join(
+        DoctorPatient, (DoctorPatient.patient_id == patient_id_column) & (DoctorPatient.doctor_id == doctor_id))
+
+    if cohort.gender is not None or cohort.age_min is not None or cohort.age_max is not None:
+        stmt = stmt.join(Patient, Patient.id == patient_id_column)
+        if cohort.gender is not None:
+            stmt = stmt.where(Patient.gender == GenderEnum(cohort.gender))
+        if cohort.age_min is not None:
+            stmt = stmt.where(Patient.birth_date <= _years_before(today, cohort.age_min))
+        if cohort.age_max is not None:
+            stmt = stmt.where(Patient.birth_date > _years_before(today, cohort.age_max + 1))
+
+    if cohort.diagnosis_category is not None:
+        stmt = stmt.where(exists().where(
+            PatientDiagnosis.patient_id == patient_id_column,
+            PatientDiagnosis.diagnosis_id == Diagnosis.id,
+            Diagnosis.category == cohort.diagnosis_category
+        ))
+    return stmt
+
+
+def _period(cohort):
+    # date_to включает весь день; у последней представимой даты следующего дня нет
+    end = datetime.combine(cohort.date_to + timedelta(days=1), datetime.min.time()) if cohort.date_to < date.max \
+        else datetime.max
+    return datetime.combine(cohort.date_from, datetime.min.time()), end
+
+
+def load_cohort(doctor_id, cohort, today=None):
+    today = today or date.today()
+    period_start, period_end = _period(cohort)
+
+    # Только нужные столбцы, порциями прямо в массив: без ORM-объектов на каждую строку
+    stmt = _cohort_statement(
+        select(Measurement.patient_id, *[getattr(Measurement, m) for m in cohort.metrics]),
+        Measurement.patient_id, doctor_id, cohort, today
+    ).where(Measurement.measured_at >= period_start, Measurement.measured_at < period_end)
+    chunks = [chunk for shard_chunks in fan_out(
+        stmt.execution_options(yield_per=FETCH_CHUNK),
+        lambda result: [np.array(part, dtype=np.float64) for part in result.partitions()]
+    ) for chunk in shard_chunks]
+
+    # Архивные блоки распаковываются сразу в массивы по столбцам
+    stmt = _cohort_statement(
+        select(MeasurementBlock.patient_id, MeasurementBlock.row_count, MeasurementBlock.payload),
+        MeasurementBlock.patient_id, doctor_id, cohort, today
+    ).where(MeasurementBlock.last_measured_at >= period_start, MeasurementBlock.first_measured_at < period_end)
+    start_us = np.datetime64(period_start, 'us').astype(np.int64)
+    end_us = np.datetime64(period_end, 'us').astype(np.int64)
+    for patient_id, row_count, payload in fan_out_rows(stmt):
+        arrays = decode_block_arrays(payload, row_count)
+        mask = (arrays['measured_at'] >= start_us) & (arrays['measured_at'] < end_us)
+        columns = [np.full(int(mask.sum()), patient_id, dtype=np.float64)]
+        for name in cohort.metrics:
+            values = arrays[name][mask].astype(np.float64)
+            if name not in FLOAT_COLUMNS:
+                values[arrays[name][mask] == NULL_INT] = np.nan
+            columns.append(values)
+        chunks.append(np.column_stack(columns))
+
+    if not chunks:
+        return np.empty((0, len(cohort.metrics) + 1))
+    return np.concatenate(chunks)
+
+
+def summarize(values, percentiles, bins):
+    values = values[~np.isnan(values)]
+    if not values.size:
+        return {'count': 0, 'mean': None, 'std': None, 'min': None, 'max': None, 'percentiles': {},
+                'histogram': {'edges': [], 'counts': []}}
+    counts, edges = np.histogram(values, bins=bins)
+    return {
+        'count': int(values.size),
+        'mean': float(values.mean()),
+        'std': float(values.std()),
+        'min': float(values.min()),
+        'max': float(values.max()),
+        'percentiles': {f'p{p:g}': float(v) for p, v in zip(percentiles, np.percentile(values, percentiles))},
+        'histogram': {'edges': edges.tolist(), 'counts': counts.tolist()}
+    }
+
+
+def _latest_for_doctor(column, patient_id_column, doctor_id):
+    # Максимум по каждому пациенту врача отдельно: поиск в индексе по patient_id вместо обхода всей таблицы
+    per_patient = select(func.max(column)).where(patient_id_column == DoctorPatient.patient_id).correlate(
+        DoctorPatient).scalar_subquery()
+    return select(func.max(per_patient)).where(DoctorPatient.doctor_id == doctor_id).scalar_subquery()
+
+
+def data_version(doctor_id):
+    # Версия меняется только при изменениях у пациентов этого врача: измерения и диагнозы только пополняются,
+    # упаковка в блоки обновляет measurement_blocks.updated_at, а состав пациентов — doctor_patients.
+    # При шардировании версия складывается из версий всех шардов
+    return tuple(tuple(row) for row in fan_out_rows(select(
+        _latest_for_doctor(Measurement.id, Measurement.patient_id, doctor_id),
+        _latest_for_doctor(MeasurementBlock.updated_at, MeasurementBlock.patient_id, doctor_id),
+        _latest_for_doctor(PatientDiagnosis.id, PatientDiagnosis.patient_id, doctor_id),
+        select(func.max(DoctorPatient.updated_at)).where(DoctorPatient.doctor_id == doctor_id).scalar_subquery(),
+        select(func.count()).where(DoctorPatient.doctor_id == doctor_id).scalar_subquery()
+    )))
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _cohort_statistics(doctor_id, cohort, version, today):
+    data = load_cohort(doctor_id, cohort, today)
+    return {
+        'cohort': {
+            'patients': int(np.unique(data[:, 0]).size),
+            'measurements': int(data.shape[0])
+        },
+        'metrics': {name: summarize(data[:, i + 1], cohort.percentiles, cohort.bins)
+                    for i, name in enumerate(cohort.metrics)}
+    }
+
+
+def cohort_statistics(doctor_id, cohort):
+    return _cohort_statistics(doctor_id, cohort, data_version(doctor_id), date.today())
@@ -3,56 +3,101 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_jwt_extended import JWTManager
 from sqlalchemy import text
 from config import Config
+from metrics import Metrics
+from query_budget import QueryBudget
+from password_hashing import PasswordHasher
+from sharding import ShardedSession, configure_binds, init_shards, is_sharded, shard_count
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': ShardedSession})
 jwt = JWTManager()
+metrics = Metrics()
+query_budgets = QueryBudget()
+password_hasher = PasswordHasher()
 
 
-def create_app():
+def create_app(config_object=Config):
     app = Flask(__name__)
-    app.config.from_object(Config)
+    app.config.from_object(config_object)
 
+    configure_binds(app)
     db.init_app(app)
     jwt.init_app(app)
+    password_hasher.init_app(app)
 
-    from models import Base, User, Patient, Doctor, Diagnosis, PatientDiagnosis, Measurement, Prescription, Complaint, \
-        Consultation, Specialization, Department, SymptomCategory, Symptom
+    from models import Base, User, Patient, Doctor, Diagnosis, PatientDiagnosis, Measurement, MeasurementBlock, \
+        Prescription, Complaint, Consultation, DoctorPatient, PatientTrend, Specialization, Department, SymptomCategory, \
+        Symptom
     from routes import bp
     app.register_blueprint(bp)
 
     with app.app_context():
-        Base.metadata.create_all(bind=db.engine)
+        # При шардировании таблицы пациента есть только в shard-файлах: пустые копии в общей базе
+        # молча отдавали бы ноль строк вместо ошибки
+        Base.metadata.create_all(bind=db.engine, tables=[t for t in Base.metadata.sorted_tables if not is_sharded(t)])
         init_db_business_logic()
+        for engine in init_shards(app, db, Base.metadata):
+            init_shard_business_logic(engine)
+        metrics.init_app(app, db.engines.values())
+        query_budgets.init_app(app, db.engines.values())
 
     return app
 
 
+# Таблицы пациента; при шардировании они, TRIGGERS и BACKFILL создаются только в shard-файлах
+PATIENT_TABLES = [
+    "CREATE TABLE IF NOT EXISTS prescription_history (id INTEGER PRIMARY KEY AUTOINCREMENT, prescription_id INTEGER NOT NULL, patient_id INTEGER NOT NULL, doctor_id INTEGER NOT NULL, medication_name TEXT NOT NULL, quantity REAL NOT NULL, dose_unit TEXT NOT NULL, frequency TEXT NOT NULL, duration_days INTEGER NOT NULL, start_date DATETIME NOT NULL, end_date DATETIME, instructions TEXT, status TEXT NOT NULL, changed_at DATETIME NOT NULL)"
+]
+
+SHARED_TABLES = [
+    "CREATE TABLE IF NOT EXISTS notifications (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL, type TEXT NOT NULL CHECK(type IN ('critical', 'warning', 'info', 'recommendation')), message TEXT NOT NULL, created_at DATETIME DEFAULT CURRENT_TIMESTAMP, is_read BOOLEAN DEFAULT 0)"
+]
+
+# Представления соединяют таблицы пациента с общими, поэтому при шардировании не поддерживаются
+VIEWS = [
+    "CREATE VIEW IF NOT EXISTS v_patient_measurements_avg AS SELECT patient_id, AVG(glucose) as avg_glucose, AVG(systolic_bp) as avg_systolic, AVG(diastolic_bp) as avg_diastolic, AVG(pulse) as avg_pulse, AVG(weight) as avg_weight FROM measurements GROUP BY patient_id",
+    "CREATE VIEW IF NOT EXISTS v_patient_prescription_compliance AS SELECT patient_id, COUNT(CASE WHEN status = 'активно' THEN 1 END) * 100.0 / COUNT(*) as compliance_rate FROM prescriptions GROUP BY patient_id",
+    "CREATE VIEW IF NOT EXISTS v_critical_measurements AS SELECT m.*, p.surname, p.name FROM measurements m JOIN patients p ON m.patient_id = p.id WHERE (m.systolic_bp > 180 OR m.systolic_bp < 90 OR m.diastolic_bp > 120 OR m.diastolic_bp < 60 OR m.glucose > 20 OR m.glucose < 2.5 OR m.pulse > 130 OR m.pulse < 40)",
+    "CREATE VIEW IF NOT EXISTS v_patient_risk_score AS SELECT p.id, p.surname, p.name, COUNT(c.id) * 10 + SUM(CASE WHEN m.systolic_bp > 160 THEN 5 ELSE 0 END) as risk_score FROM patients p LEFT JOIN complaints c ON p.id = c.patient_id LEFT JOIN measurements m ON p.id = m.patient_id GROUP BY p.id, p.surname, p.name"
+]
+
+TRIGGERS = [
+    "CREATE TRIGGER IF NOT EXISTS trg_prescription_archive AFTER UPDATE ON prescriptions BEGIN INSERT INTO prescription_history (prescription_id, patient_id, doctor_id, medication_name, quantity, dose_unit, frequency, duration_days, start_date, end_date, instructions, status, changed_at) VALUES (OLD.id, OLD.patient_id, OLD.doctor_id, OLD.medication_name, OLD.quantity, OLD.dose_unit, OLD.frequency, OLD.duration_days, OLD.start_date, OLD.end_date, OLD.instructions, OLD.status, CURRENT_TIMESTAMP); END",
+    "CREATE TRIGGER IF NOT EXISTS trg_consultation_link AFTER INSERT ON consultations BEGIN INSERT INTO doctor_patients (doctor_id, patient_id, first_consultation_at, last_consultation_at, consultations_count, created_at, updated_at) VALUES (NEW.doctor_id, NEW.patient_id, NEW.consultation_date, NEW.consultation_date, 1, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP) ON CONFLICT(doctor_id, patient_id) DO UPDATE SET first_consultation_at = MIN(first_consultation_at, excluded.first_consultation_at), last_consultation_at = MAX(last_consultation_at, excluded.last_consultation_at), consultations_count = consultations_count + 1, updated_at = CURRENT_TIMESTAMP; END",
+    "CREATE TRIGGER IF NOT EXISTS trg_consultation_unlink AFTER DELETE ON consultations BEGIN DELETE FROM doctor_patients WHERE doctor_id = OLD.doctor_id AND patient_id = OLD.patient_id AND consultations_count <= 1; UPDATE doctor_patients SET consultations_count = consultations_count - 1, first_consultation_at = (SELECT MIN(consultation_date) FROM consultations WHERE doctor_id = OLD.doctor_id AND patient_id = OLD.patient_id), last_consultation_at = (SELECT MAX(consultation_date) FROM consultations WHERE doctor_id = OLD.doctor_id AND patient_id = OLD.patient_id), updated_at = CURRENT_TIMESTAMP WHERE doctor_id = OLD.doctor_id AND patient_id = OLD.patient_id; END",
+    "CREATE TRIGGER IF NOT EXISTS trg_measurement_validation BEFORE INSERT ON measurements BEGIN SELECT CASE WHEN NEW.systolic_bp < NEW.diastolic_bp THEN RAISE(ABORT, 'Systolic BP cannot be less than diastolic BP') WHEN NEW.glucose < 0 THEN RAISE(ABORT, 'Glucose cannot be negative') WHEN NEW.systolic_bp < 50 OR NEW.systolic_bp > 300 THEN RAISE(ABORT, 'Invalid systolic BP value') WHEN NEW.diastolic_bp < 30 OR NEW.diastolic_bp > 200 THEN RAISE(ABORT, 'Invalid diastolic BP value') WHEN NEW.pulse < 20 OR NEW.pulse > 250 THEN RAISE(ABORT, 'Invalid pulse value') WHEN NEW.weight < 10 OR NEW.weight > 500 THEN RAISE(ABORT, 'Invalid weight value') END; END"
+]
+
+# Заполняем связи врач–пациент для консультаций, созданных до появления триггеров
+BACKFILL = [
+    "INSERT INTO doctor_patients (doctor_id, patient_id, first_consultation_at, last_consultation_at, consultations_count, created_at, updated_at) SELECT doctor_id, patient_id, MIN(consultation_date), MAX(consultation_date), COUNT(*), CURRENT_TIMESTAMP, CURRENT_TIMESTAMP FROM consultations WHERE NOT EXISTS (SELECT 1 FROM doctor_patients) GROUP BY doctor_id, patient_id"
+]
+
+
 def init_db_business_logic():
-    tables = [
-        "CREATE TABLE IF NOT EXISTS prescription_history (id INTEGER PRIMARY KEY AUTOINCREMENT, prescription_id INTEGER NOT NULL, patient_id INTEGER NOT NULL, doctor_id INTEGER NOT NULL, medication_name TEXT NOT NULL, quantity REAL NOT NULL, dose_unit TEXT NOT NULL, frequency TEXT NOT NULL, duration_days INTEGER NOT NULL, start_date DATETIME NOT NULL, end_date DATETIME, instructions TEXT, status TEXT NOT NULL, changed_at DATETIME NOT NULL)",
-        "CREATE TABLE IF NOT EXISTS notifications (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL, type TEXT NOT NULL CHECK(type IN ('critical', 'warning', 'info', 'recommendation')), message TEXT NOT NULL, created_at DATETIME DEFAULT CURRENT_TIMESTAMP, is_read BOOLEAN DEFAULT 0)"
-    ]
-
-    views = [
-        "CREATE VIEW IF NOT EXISTS v_patient_measurements_avg AS SELECT patient_id, AVG(glucose) as avg_glucose, AVG(systolic_bp) as avg_systolic, AVG(diastolic_bp) as avg_diastolic, AVG(pulse) as avg_pulse, AVG(weight) as avg_weight FROM measurements GROUP BY patient_id",
-        "CREATE VIEW IF NOT EXISTS v_patient_prescription_compliance AS SELECT patient_id, COUNT(CASE WHEN status = 'активно' THEN 1 END) * 100.0 / COUNT(*) as compliance_rate FROM prescriptions GROUP BY patient_id",
-        "CREATE VIEW IF NOT EXISTS v_critical_measurements AS SELECT m.*, p.surname, p.name FROM measurements m JOIN patients p ON m.patient_id = p.id WHERE (m.systolic_bp > 180 OR m.systolic_bp < 90 OR m.diastolic_bp > 120 OR m.diastolic_bp < 60 OR m.glucose > 20 OR m.glucose < 2.5 OR m.pulse > 130 OR m.pulse < 40)",
-        "CREATE VIEW IF NOT EXISTS v_patient_risk_score AS SELECT p.id, p.surname, p.name, COUNT(c.id) * 10 + SUM(CASE WHEN m.systolic_bp > 160 THEN 5 ELSE 0 END) as risk_score FROM patients p LEFT JOIN complaints c ON p.id = c.patient_id LEFT JOIN measurements m ON p.id = m.patient_id GROUP BY p.id, p.surname, p.name"
-    ]
-
-    triggers = [
-        "CREATE TRIGGER IF NOT EXISTS trg_prescription_archive AFTER UPDATE ON prescriptions BEGIN INSERT INTO prescription_history (prescription_id, patient_id, doctor_id, medication_name, quantity, dose_unit, frequency, duration_days, start_date, end_date, instructions, status, changed_at) VALUES (OLD.id, OLD.patient_id, OLD.doctor_id, OLD.medication_name, OLD.quantity, OLD.dose_unit, OLD.frequency, OLD.duration_days, OLD.start_date, OLD.end_date, OLD.instructions, OLD.status, CURRENT_TIMESTAMP); END",
-        "CREATE TRIGGER IF NOT EXISTS trg_measurement_validation BEFORE INSERT ON measurements BEGIN SELECT CASE WHEN NEW.systolic_bp < NEW.diastolic_bp THEN RAISE(ABORT, 'Systolic BP cannot be less than diastolic BP') WHEN NEW.glucose < 0 THEN RAISE(ABORT, 'Glucose cannot be negative') WHEN NEW.systolic_bp < 50 OR NEW.systolic_bp > 300 THEN RAISE(ABORT, 'Invalid systolic BP value') WHEN NEW.diastolic_bp < 30 OR NEW.diastolic_bp > 200 THEN RAISE(ABORT, 'Invalid diastolic BP value') WHEN NEW.pulse < 20 OR NEW.pulse > 250 THEN RAISE(ABORT, 'Invalid pulse value') WHEN NEW.weight < 10 OR NEW.weight > 500 THEN RAISE(ABORT, 'Invalid weight value') END; END"
-    ]
-
-    for stmt in tables:
+    if shard_count():
+        for stmt in SHARED_TABLES:
+            db.session.execute(text(stmt))
+        db.session.commit()
+        return
+
+    for stmt in PATIENT_TABLES + SHARED_TABLES:
         db.session.execute(text(stmt))
     db.session.commit()
 
-    for stmt in views:
+    for stmt in VIEWS:
         db.session.execute(text(stmt))
     db.session.commit()
 
-    for stmt in triggers:
+    for stmt in TRIGGERS:
         db.session.execute(text(stmt))
-    db.session.commit()
\ No newline at end of file
+    db.session.commit()
+
+    for stmt in BACKFILL:
+        db.session.execute(text(stmt))
+    db.session.commit()
+
+
+def init_shard_business_logic(engine):
+    with engine.begin() as connection:
+        for stmt in PATIENT_TABLES + TRIGGERS + BACKFILL:
+            connection.execute(text(stmt))
\ No newline at end of file
@@ -0,0 +1,103 @@
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+
+from sqlalchemy import text
+
+from app import create_app, db
+from benchmarks.harness import summarize_latencies, save_results
+from data.generate_data import make_config, BASE_DATE
+import measurement_archive
+from models import Measurement, MeasurementBlock
+
+
+def database_size():
+    # VACUUM нельзя выполнить внутри транзакции
+    db.session.commit()
+    db.session.execute(text('VACUUM'))
+    page_count = db.session.execute(text('PRAGMA page_count')).scalar()
+    page_size = db.session.execute(text('PRAGMA page_size')).scalar()
+    return page_count * page_size
+
+
+def range_scan(patient_ids, date_from, date_to, repeat):
+    latencies, rows = [], 0
+    for _ in range(repeat):
+        for patient_id in patient_ids:
+            db.session.expunge_all()
+            started = time.perf_counter()
+            rows += len(measurement_archive.measurements_in_range(patient_id, date_from, date_to))
+            latencies.append((time.perf_counter() - started) * 1000)
+    return {'rows_per_scan': rows / len(latencies) if latencies else 0, 'latency_ms': summarize_latencies(latencies)}
+
+
+def snapshot(patient_ids, date_from, date_to, repeat):
+    return {
+        'db_size_bytes': database_size(),
+        'measurement_rows': db.session.query(Measurement).count(),
+        'measurement_blocks': db.session.query(MeasurementBlock).count(),
+        'range_scan': range_scan(patient_ids, date_from, date_to, repeat)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Размер БД и скорость чтения диапазона до и после упаковки измерений')
+    parser.add_argument('--database', help='URI базы с синтетическими данными (будет скопирована)')
+    parser.add_argument('--older-than-days', type=int, default=365)
+    parser.add_argument('--range-days', type=int, default=2 * 365, help='Ширина читаемого диапазона')
+    parser.add_argument('--patients', type=int, default=50, help='Сколько пациентов читать')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='Файл для JSON-результатов')
+    options = parser.parse_args()
+
+    source_app = create_app(make_config(options.database))
+    with source_app.app_context():
+        source_path = db.engine.url.database
+        db.engine.dispose()
+
+    # Упаковка необратима, поэтому работаем с копией базы
+    workdir = tempfile.mkdtemp(prefix='medsystem-compaction-')
+    copy_path = os.path.join(workdir, 'medical.db')
+    shutil.copyfile(source_path, copy_path)
+
+    try:
+        app = create_app(make_config(f'sqlite:///{copy_path}'))
+        with app.app_context():
+            # Синтетические данные заканчиваются на BASE_DATE, от неё и считаем возраст измерений
+            now = BASE_DATE
+            date_to, date_from = now, now - timedelta(days=options.range_days)
+            candidates = [pid for (pid,) in db.session.query(Measurement.patient_id).distinct().all()]
+            patient_ids = random.Random(options.seed).sample(candidates, min(options.patients, len(candidates)))
+
+            before = snapshot(patient_ids, date_from, date_to, options.repeat)
+            started = time.perf_counter()
+            compacted_patients, moved = measurement_archive.compact_measurements(options.older_than_days, now=now)
+            compaction_seconds = time.perf_counter() - started
+            after = snapshot(patient_ids, date_from, date_to, options.repeat)
+            db.engine.dispose()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    for label, result in (('до', before), ('после', after)):
+        scan = result['range_scan']['latency_ms']
+        print(f"{label:6} размер {result['db_size_bytes'] / 2 ** 20:9.1f} МБ  строк {result['measurement_rows']:>10}  "
+              f"блоков {result['measurement_blocks']:>8}  диапазон p50 {scan['p50']} мс  p95 {scan['p95']} мс")
+    print(f"Упаковка: {moved} измерений у {compacted_patients} пациентов за {compaction_seconds:.1f} с")
+
+    payload = {
+        'config': vars(options),
+        'compaction': {'patients': compacted_patients, 'moved_rows': moved,
+                       'seconds': round(compaction_seconds, 3)},
+        'before': before,
+        'after': after
+    }
+    print(f"Результаты сохранены в {save_results('compaction', payload, options.output)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,235 @@
+import argparse
+import json
+import random
+import shutil
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+
+from flask_jwt_extended import create_access_token, create_refresh_token
+
+from app import create_app, db
+from benchmarks.harness import QueryCounter, run_concurrent, summarize_latencies, save_results, load_results, \
+    copy_database
+from data.generate_data import make_config
+from models import User, Patient, Symptom, RoleEnum
+
+
+class Fixtures:
+    def __init__(self, app, rng, sample_size, password):
+        with app.app_context():
+            patient_users = db.session.query(User).filter(User.role == RoleEnum.patient, User.patient_id.isnot(None),
+                                                          User.is_active.is_(True)).limit(sample_size * 10).all()
+            doctor_users = db.session.query(User).filter(User.role == RoleEnum.doctor, User.doctor_id.isnot(None),
+                                                         User.is_active.is_(True)).limit(sample_size * 10).all()
+            if not patient_users or not doctor_users:
+                raise SystemExit('В базе нет активных пациентов или врачей, сначала запустите data/generate_data.py')
+
+            patient_users = rng.sample(patient_users, min(sample_size, len(patient_users)))
+            doctor_users = rng.sample(doctor_users, min(sample_size, len(doctor_users)))
+
+            self.patient_emails = [u.email for u in patient_users]
+            self.patient_tokens = [create_access_token(identity=str(u.id)) for u in patient_users]
+            self.doctor_tokens = [create_access_token(identity=str(u.id)) for u in doctor_users]
+            self.refresh_tokens = [create_refresh_token(identity=str(u.id)) for u in patient_users]
+            self.patient_ids = [pid for (pid,) in db.session.query(Patient.id).limit(sample_size * 10).all()]
+            self.symptom_ids = [sid for (sid,) in db.session.query(Symptom.id).all()]
+        self.password = password
+
+
+# Каждый сценарий возвращает (метод, путь, токен, тело запроса)
+def scenarios(fx):
+    # Префикс прогона: при том же seed повторный запуск не должен упираться в «Email already exists»
+    run_id = uuid.uuid4().hex[:8]
+
+    def measurement_body(rng):
+        systolic = rng.randint(100, 160)
+        return {'glucose': round(rng.uniform(4, 9), 1), 'systolic_bp': systolic,
+                'diastolic_bp': systolic - rng.randint(30, 50), 'pulse': rng.randint(55, 100),
+                'weight': round(rng.uniform(50, 110), 1)}
+
+    return {
+        'auth_register': lambda rng: ('POST', '/auth/register', None, {
+            'email': f'bench-{run_id}-{uuid.UUID(int=rng.getrandbits(128))}@synthetic.local', 'password': fx.password,
+            'role': 'patient', 'surname': 'Нагрузочный', 'name': 'Тест', 'gender': 'м',
+            'birth_date': '1980-01-01'}),
+        'auth_login': lambda rng: ('POST', '/auth/login', None, {
+            'email': rng.choice(fx.patient_emails), 'password': fx.password}),
+        'auth_refresh': lambda rng: ('POST', '/auth/refresh', rng.choice(fx.refresh_tokens), None),
+        'patient_profile': lambda rng: ('GET', '/patient/profile', rng.choice(fx.patient_tokens), None),
+        'patient_measurements_list': lambda rng: ('GET', '/patient/measurements',
+                                                  rng.choice(fx.patient_tokens), None),
+        'patient_measurements_add': lambda rng: ('POST', '/patient/measurements', rng.choice(fx.patient_tokens),
+                                                 measurement_body(rng)),
+        'patient_prescriptions': lambda rng: ('GET', '/patient/prescriptions', rng.choice(fx.patient_tokens), None),
+        'patient_complaints_list': lambda rng: ('GET', '/patient/complaints', rng.choice(fx.patient_tokens), None),
+        'patient_complaints_add': lambda rng: ('POST', '/patient/complaints', rng.choice(fx.patient_tokens), {
+            'symptom_id': rng.choice(fx.symptom_ids), 'severity': 'средняя'}),
+        'doctor_patients': lambda rng: ('GET', '/doctor/patients', rng.choice(fx.doctor_tokens), None),
+        'doctor_patients_by_surname': lambda rng: ('GET', '/doctor/patients?sort=surname',
+                                                   rng.choice(fx.doctor_tokens), None),
+        'doctor_analytics': lambda rng: ('GET', '/doctor/analytics/measurements?date_from=2025-10-01'
+                                                '&date_to=2025-12-31', rng.choice(fx.doctor_tokens), None),
+        'doctor_analytics_cohort': lambda rng: ('GET', '/doctor/analytics/measurements?date_from=2025-10-01'
+                                                       '&date_to=2025-12-31&diagnosis_category=Эндокринология'
+                                                       '&age_min=40&age_max=70', rng.choice(fx.doctor_tokens), None),
+        'doctor_patient_card': lambda rng: ('GET', f'/doctor/patient/{rng.choice(fx.patient_ids)}/card',
+                                            rng.choice(fx.doctor_tokens), None),
+        'doctor_prescriptions_add': lambda rng: ('POST', '/doctor/prescriptions', rng.choice(fx.doctor_tokens), {
+            'patient_id': rng.choice(fx.patient_ids), 'medication_name': 'Метформин', 'quantity': 500,
+            'dose_unit': 'мг', 'frequency': '2 раза в день', 'duration_days': 30,
+            'start_date': '2026-01-01T00:00:00'}),
+    }
+
+
+class TestClientTransport:
+    def __init__(self, app):
+        self.app = app
+        self._local = threading.local()
+        self.counter = QueryCounter(db.engines.values())
+
+    def __enter__(self):
+        self.counter.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        self.counter.__exit__(*exc)
+
+    def request(self, method, path, token, body):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        headers = {'Authorization': f'Bearer {token}'} if token else {}
+        self.counter.reset()
+        response = client.open(path, method=method, json=body, headers=headers)
+        return response.status_code, self.counter.count
+
+
+class HttpTransport:
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def request(self, method, path, token, body):
+        headers = {'Content-Type': 'application/json'}
+        if token:
+            headers['Authorization'] = f'Bearer {token}'
+        data = json.dumps(body).encode() if body is not None else None
+        req = urllib.request.Request(self.base_url + path, data=data, headers=headers, method=method)
+        try:
+            with urllib.request.urlopen(req) as response:
+                response.read()
+                return response.status, None
+        except urllib.error.HTTPError as e:
+            return e.code, None
+
+
+def run_scenario(transport, build_request, requests, workers, seed):
+    def task(i):
+        method, path, token, body = build_request(random.Random(seed * 1000003 + i))
+        started = time.perf_counter()
+        status, queries = transport.request(method, path, token, body)
+        return (time.perf_counter() - started) * 1000, status, queries
+
+    results, elapsed = run_concurrent(task, requests, workers)
+    latencies = [r[0] for r in results]
+    queries = [r[2] for r in results if r[2] is not None]
+    return {
+        'requests': requests,
+        'errors': sum(1 for r in results if r[1] >= 400),
+        'status_codes': {str(code): sum(1 for r in results if r[1] == code) for code in sorted({r[1] for r in results})},
+        'throughput_rps': round(requests / elapsed, 2) if elapsed else None,
+        'latency_ms': summarize_latencies(latencies),
+        'queries_per_request': {
+            'mean': round(sum(queries) / len(queries), 2),
+            'max': max(queries)
+        } if queries else None
+    }
+
+
+def print_comparison(current, previous):
+    print(f"\nСравнение с {previous.get('revision')} ({previous.get('started_at')}):")
+    for name, result in current['endpoints'].items():
+        old = previous.get('endpoints', {}).get(name)
+        if not old:
+            continue
+        deltas = []
+        for key in ('p50', 'p95', 'p99'):
+            new_value, old_value = result['latency_ms'][key], old['latency_ms'][key]
+            if new_value is not None and old_value:
+                deltas.append(f"{key} {(new_value - old_value) / old_value * 100:+.1f}%")
+        if result['throughput_rps'] and old.get('throughput_rps'):
+            deltas.append(f"rps {(result['throughput_rps'] - old['throughput_rps']) / old['throughput_rps'] * 100:+.1f}%")
+        print(f"  {name:28} {', '.join(deltas)}")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Нагрузочный прогон всех эндпоинтов API')
+    parser.add_argument('--database', help='URI базы данных (по умолчанию из Config)')
+    parser.add_argument('--url', help='Адрес запущенного сервера; без него используется тестовый клиент Flask')
+    parser.add_argument('--requests', type=int, default=200, help='Запросов на каждый эндпоинт')
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--sample-size', type=int, default=50, help='Сколько пользователей каждой роли участвуют')
+    parser.add_argument('--password', default='default123')
+    parser.add_argument('--only', nargs='*', help='Запустить только перечисленные сценарии')
+    parser.add_argument('--output', help='Файл для JSON-результатов')
+    parser.add_argument('--compare', help='JSON предыдущего прогона для сравнения')
+    return parser
+
+
+def main():
+    options = build_parser().parse_args()
+    config = make_config(options.database)
+    # Сценарии с записью выполняются на копии базы: каждый прогон стартует с одних и тех же данных
+    workdir = tempfile.mkdtemp(prefix='medsystem-bench-')
+    try:
+        app = create_app(config if options.url else copy_database(config, workdir))
+        fixtures = Fixtures(app, random.Random(options.seed), options.sample_size, options.password)
+        selected = {name: build for name, build in scenarios(fixtures).items()
+                    if not options.only or name in options.only}
+
+        results = {}
+        with app.app_context():
+            transport = HttpTransport(options.url) if options.url else TestClientTransport(app)
+            with transport:
+                for name, build_request in selected.items():
+                    results[name] = run_scenario(transport, build_request, options.requests, options.workers,
+                                                 options.seed)
+                    latency = results[name]['latency_ms']
+                    queries = results[name]['queries_per_request']
+                    print(f"{name:28} {results[name]['throughput_rps']:>9} rps  p50 {latency['p50']:>8} ms  "
+                          f"p95 {latency['p95']:>8} ms  p99 {latency['p99']:>8} ms  "
+                          f"запросов к БД {queries['mean'] if queries else '-'}  ошибок {results[name]['errors']}")
+            for engine in db.engines.values():
+                engine.dispose()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    payload = {
+        'config': {
+            'database': config.SQLALCHEMY_DATABASE_URI,
+            'transport': 'http' if options.url else 'test_client',
+            'url': options.url,
+            'requests': options.requests,
+            'workers': options.workers,
+            'seed': options.seed,
+            'sample_size': options.sample_size
+        },
+        'endpoints': results
+    }
+    print(f"\nРезультаты сохранены в {save_results('endpoints', payload, options.output)}")
+    if options.compare:
+        print_comparison(payload, load_results(options.compare))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+import json
+import os
+import shutil
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from sqlalchemy import event
+
+from app import create_app, db
+from data.generate_data import make_config
+from sharding import share_request_state, unshare_request_state
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    k = (len(sorted_values) - 1) * p / 100
+    low = int(k)
+    high = min(low + 1, len(sorted_values) - 1)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (k - low)
+
+
+def summarize_latencies(latencies_ms):
+    values = sorted(latencies_ms)
+    if not values:
+        return {'p50': None, 'p95': None, 'p99': None, 'mean': None, 'max': None}
+    return {
+        'p50': round(percentile(values, 50), 3),
+        'p95': round(percentile(values, 95), 3),
+        'p99': round(percentile(values, 99), 3),
+        'mean': round(sum(values) / len(values), 3),
+        'max': round(values[-1], 3)
+    }
+
+
+# Считает SQL-запросы, выполненные текущим потоком, через события движка
+class QueryCounter:
+    def __init__(self, engines):
+        self.engines = list(engines)
+        self._local = threading.local()
+
+    def __enter__(self):
+        for engine in self.engines:
+            event.listen(engine, 'before_cursor_execute', self._on_execute)
+        # Запросы на шардах идут из потоков fan_out и должны попадать в счётчик вызывающего потока
+        share_request_state(self._local, 'statements')
+        return self
+
+    def __exit__(self, *exc):
+        unshare_request_state(self._local, 'statements')
+        for engine in self.engines:
+            event.remove(engine, 'before_cursor_execute', self._on_execute)
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        statements = getattr(self._local, 'statements', None)
+        if statements is None:
+            statements = self._local.statements = []
+        statements.append(statement)
+
+    def reset(self):
+        self._local.statements = []
+
+    @property
+    def count(self):
+        return len(getattr(self._local, 'statements', None) or ())
+
+
+# Выполняет task(i) total раз в пуле из workers потоков, возвращает результаты и общее время в секундах
+def run_concurrent(task, total, workers):
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(task, range(total)))
+    return results, time.perf_counter() - started
+
+
+# Копирует базу и файлы шардов в workdir, чтобы сценарии с записью не меняли исходные данные между прогонами
+def copy_database(config, workdir):
+    app = create_app(config)
+    with app.app_context():
+        sources = {key: engine.url.database for key, engine in db.engines.items()}
+        for engine in db.engines.values():
+            engine.dispose()
+
+    for key, path in sources.items():
+        shutil.copyfile(path, os.path.join(workdir, 'medical.db' if key is None else f'medical_{key}.db'))
+    return make_config(f"sqlite:///{os.path.join(workdir, 'medical.db')}", app.config.get('SHARD_COUNT', 0),
+                       f"sqlite:///{os.path.join(workdir, 'medical_shard_{}.db')}")
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(RESULTS_DIR)).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def save_results(name, payload, output=None):
+    payload = {
+        'benchmark': name,
+        'started_at': datetime.utcnow().isoformat(timespec='seconds'),
+        'revision': git_revision(),
+        **payload
+    }
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{name}-{datetime.utcnow().strftime('%Y%m%dT%H%M%S')}.json")
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(payload, f, ensure_ascii=False, indent=2)
+    return output
+
+
+def load_results(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
@@ -0,0 +1,98 @@
+import argparse
+import random
+import threading
+import time
+
+from app import create_app
+from benchmarks.endpoints import Fixtures, TestClientTransport, HttpTransport
+from benchmarks.harness import summarize_latencies, save_results
+from data.generate_data import make_config
+
+READ_PATHS = ('/patient/profile', '/patient/measurements', '/patient/prescriptions')
+
+
+def run_phase(transport, fixtures, duration, read_workers, login_workers, seed):
+    reads, logins = [], []
+    stop = threading.Event()
+
+    def reader(n):
+        rng = random.Random(seed * 7919 + n)
+        while not stop.is_set():
+            started = time.perf_counter()
+            status, _ = transport.request('GET', rng.choice(READ_PATHS), rng.choice(fixtures.patient_tokens), None)
+            reads.append(((time.perf_counter() - started) * 1000, status))
+
+    def login(n):
+        rng = random.Random(seed * 104729 + n)
+        while not stop.is_set():
+            started = time.perf_counter()
+            status, _ = transport.request('POST', '/auth/login', None, {
+                'email': rng.choice(fixtures.patient_emails), 'password': fixtures.password})
+            logins.append(((time.perf_counter() - started) * 1000, status))
+
+    threads = [threading.Thread(target=reader, args=(i,)) for i in range(read_workers)] + \
+              [threading.Thread(target=login, args=(i,)) for i in range(login_workers)]
+    for t in threads:
+        t.start()
+    time.sleep(duration)
+    stop.set()
+    for t in threads:
+        t.join()
+
+    return {
+        'reads': {
+            'requests': len(reads),
+            'throughput_rps': round(len(reads) / duration, 2),
+            'errors': sum(1 for _, status in reads if status >= 400),
+            'latency_ms': summarize_latencies([latency for latency, _ in reads])
+        },
+        'logins': {
+            'requests': len(logins),
+            'succeeded': sum(1 for _, status in logins if status == 200),
+            'rejected_busy': sum(1 for _, status in logins if status == 503),
+            'latency_ms': summarize_latencies([latency for latency, status in logins if status == 200])
+        } if login_workers else None
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Задержка чтения во время шквала логинов')
+    parser.add_argument('--database', help='URI базы с синтетическими данными')
+    parser.add_argument('--url', help='Адрес запущенного сервера; лимит хеширования тогда задаётся его конфигурацией')
+    parser.add_argument('--duration', type=float, default=10.0, help='Длительность каждой фазы, с')
+    parser.add_argument('--read-workers', type=int, default=4)
+    parser.add_argument('--login-workers', type=int, default=32)
+    parser.add_argument('--hash-workers', type=int, nargs='*', default=[64, 2],
+                        help='Лимиты параллельного хеширования для сравнения (большой лимит ~ без ограничения)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--sample-size', type=int, default=50)
+    parser.add_argument('--password', default='default123')
+    parser.add_argument('--output', help='Файл для JSON-результатов')
+    options = parser.parse_args()
+
+    runs = []
+    for hash_workers in ([None] if options.url else options.hash_workers):
+        config = make_config(options.database)
+        if hash_workers is not None:
+            config = type('LoginStormConfig', (config,), {'PASSWORD_HASH_WORKERS': hash_workers})
+        app = create_app(config)
+        fixtures = Fixtures(app, random.Random(options.seed), options.sample_size, options.password)
+
+        with app.app_context():
+            transport = HttpTransport(options.url) if options.url else TestClientTransport(app)
+            with transport:
+                baseline = run_phase(transport, fixtures, options.duration, options.read_workers, 0, options.seed)
+                storm = run_phase(transport, fixtures, options.duration, options.read_workers,
+                                  options.login_workers, options.seed)
+
+        runs.append({'hash_workers': hash_workers, 'baseline': baseline, 'storm': storm})
+        print(f"hash_workers={hash_workers}: чтение p99 {baseline['reads']['latency_ms']['p99']} мс -> "
+              f"{storm['reads']['latency_ms']['p99']} мс во время логинов; "
+              f"логинов {storm['logins']['succeeded']}, отказов 503 {storm['logins']['rejected_busy']}")
+
+    payload = {'config': vars(options), 'runs': runs}
+    print(f"Результаты сохранены в {save_results('login_storm', payload, options.output)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+import argparse
+import os
+import random
+import shutil
+import tempfile
+
+from app import create_app, db
+from benchmarks.endpoints import Fixtures, TestClientTransport, run_scenario, scenarios
+from benchmarks.harness import save_results
+from data.generate_data import build_parser, generate, make_config
+
+
+def run(shards, options):
+    # Каждый прогон — в чистом каталоге: общая база и shards файлов шардов
+    workdir = tempfile.mkdtemp(prefix='medsystem-shards-')
+    try:
+        config = make_config(f"sqlite:///{os.path.join(workdir, 'medical.db')}", shards,
+                             f"sqlite:///{os.path.join(workdir, 'medical_shard_{}.db')}")
+        app = create_app(config)
+        with app.app_context():
+            # У каждого пациента в генераторе есть хотя бы одна консультация, поэтому среднее не может быть нулевым
+            generate(build_parser().parse_args([
+                '--seed', str(options.seed), '--patients', str(options.patients), '--doctors', '5',
+                '--measurements-per-patient', '0', '--consultations-per-patient', '1',
+                '--complaints-per-patient', '0', '--prescriptions-per-patient', '0',
+                '--password', options.password]))
+
+        fixtures = Fixtures(app, random.Random(options.seed), options.patients, options.password)
+        with app.app_context():
+            with TestClientTransport(app) as transport:
+                result = run_scenario(transport, scenarios(fixtures)['patient_measurements_add'],
+                                      options.requests, options.workers, options.seed)
+            for engine in db.engines.values():
+                engine.dispose()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Пропускная способность записи измерений при разном числе шардов')
+    parser.add_argument('--shards', type=int, nargs='*', default=[1, 4, 8],
+                        help='Числа шардов для сравнения (0 — одна база без шардирования)')
+    parser.add_argument('--patients', type=int, default=200)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--workers', type=int, default=16)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--password', default='default123')
+    parser.add_argument('--output', help='Файл для JSON-результатов')
+    options = parser.parse_args()
+
+    runs = []
+    for shards in options.shards:
+        result = run(shards, options)
+        runs.append({'shards': shards, **result})
+        latency = result['latency_ms']
+        print(f"шардов {shards}: {result['throughput_rps']} записей/с, p50 {latency['p50']} мс, "
+              f"p99 {latency['p99']} мс, ошибок {result['errors']}")
+
+    payload = {'config': vars(options), 'runs': runs}
+    print(f"Результаты сохранены в {save_results('shard_writes', payload, options.output)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -10,4 +10,28 @@ class Config:
     JWT_REFRESH_TOKEN_EXPIRES = timedelta(days=30)
     JWT_TOKEN_LOCATION = ['headers']
     JWT_HEADER_NAME = 'Authorization'
-    JWT_HEADER_TYPE = 'Bearer'
\ No newline at end of file
+    JWT_HEADER_TYPE = 'Bearer'
+    # Метрики включаются явно; /metrics отдаётся только с заголовком Authorization: Bearer <METRICS_TOKEN>,
+    # т.к. содержит текст медленных запросов и трафик по эндпоинтам
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '0') == '1'
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+    METRICS_SLOW_QUERY_MS = float(os.environ.get('METRICS_SLOW_QUERY_MS', 100))
+    METRICS_SLOW_QUERY_LIMIT = 100
+    METRICS_PATH = '/metrics'
+    # off — без проверки, warn — предупреждение в лог, raise — исключение (для разработки и тестов)
+    QUERY_BUDGET_MODE = os.environ.get('QUERY_BUDGET_MODE', 'warn')
+    # Измерения старше этого срока переносятся в помесячные сжатые блоки (python measurement_archive.py)
+    MEASUREMENT_ARCHIVE_AFTER_DAYS = int(os.environ.get('MEASUREMENT_ARCHIVE_AFTER_DAYS', 365))
+    # Сглаживание трендов пациента и порог отклонения от его собственной нормы (в стандартных отклонениях)
+    TREND_ALPHA = float(os.environ.get('TREND_ALPHA', 0.1))
+    TREND_Z_THRESHOLD = float(os.environ.get('TREND_Z_THRESHOLD', 3.5))
+    TREND_WARMUP = int(os.environ.get('TREND_WARMUP', 10))
+    # Хеширование паролей: параметры новых хешей, число одновременных вычислений и время ожидания слота.
+    # При входе хеш обновляется только до более сильных параметров того же семейства или с устаревшего семейства
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt')
+    PASSWORD_HASH_DEPRECATED = tuple(filter(None, os.environ.get('PASSWORD_HASH_DEPRECATED', '').split(',')))
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 2))
+    PASSWORD_HASH_QUEUE_TIMEOUT = float(os.environ.get('PASSWORD_HASH_QUEUE_TIMEOUT', 2.0))
+    # 0 — одна база; иначе таблицы пациента раскладываются по SHARD_COUNT файлам по patient_id
+    SHARD_COUNT = int(os.environ.get('SHARD_COUNT', 0))
+    SHARD_DATABASE_URI = os.environ.get('SHARD_DATABASE_URI', 'sqlite:///medical_shard_{}.db')
\ No newline at end of file
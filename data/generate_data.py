@@ -0,0 +1,375 @@
+import argparse
+import random
+from datetime import datetime, date, timedelta
+from sqlalchemy import select, func
+from werkzeug.security import generate_password_hash
+from app import create_app, db
+from config import Config
+from models import *
+from sharding import GLOBAL_ID_TABLES, fan_out_rows, is_sharded, shard_for, shard_row_id
+
+# Фиксированная точка отсчёта, чтобы при одинаковом seed получались одинаковые данные
+BASE_DATE = datetime(2026, 1, 1)
+
+SURNAMES = ['Иванов', 'Петров', 'Сидоров', 'Смирнов', 'Кузнецов', 'Попов', 'Васильев', 'Соколов', 'Михайлов',
+            'Новиков', 'Фёдоров', 'Морозов', 'Волков', 'Алексеев', 'Лебедев', 'Семёнов', 'Егоров', 'Павлов']
+MALE_NAMES = ['Александр', 'Сергей', 'Дмитрий', 'Андрей', 'Алексей', 'Иван', 'Михаил', 'Николай', 'Павел']
+FEMALE_NAMES = ['Анна', 'Мария', 'Елена', 'Ольга', 'Наталья', 'Татьяна', 'Ирина', 'Светлана', 'Екатерина']
+PATRONIMS = ['Александров', 'Сергеев', 'Дмитриев', 'Андреев', 'Иванов', 'Михайлов', 'Николаев', None]
+CITIES = ['Москва', 'Санкт-Петербург', 'Казань', 'Новосибирск', 'Екатеринбург']
+STREETS = ['Ленина', 'Мира', 'Садовая', 'Гагарина', 'Пушкина', 'Советская']
+
+SPECIALIZATIONS = ['Терапевт', 'Кардиолог', 'Эндокринолог', 'Невролог', 'Пульмонолог', 'Гастроэнтеролог']
+DEPARTMENTS = ['Терапевтическое', 'Кардиологическое', 'Эндокринологическое', 'Неврологическое', 'Поликлиника']
+
+SYMPTOMS = {
+    'Сердечно-сосудистые': [('Боль в груди', 'Давящая боль за грудиной'), ('Учащённое сердцебиение', None),
+                            ('Отёки ног', 'Отёки к вечеру')],
+    'Неврологические': [('Головная боль', 'Боль в затылочной области'), ('Головокружение', None)],
+    'Эндокринные': [('Жажда', 'Постоянное чувство жажды'), ('Слабость', 'Общая слабость')],
+    'Дыхательные': [('Одышка', 'Одышка при нагрузке'), ('Кашель', None)],
+}
+
+# (код МКБ-10, название, категория, сдвиг базовой глюкозы, сдвиг базового систолического давления)
+DIAGNOSES = [
+    ('E11', 'Сахарный диабет 2 типа', 'Эндокринология', 3.5, 5),
+    ('E10', 'Сахарный диабет 1 типа', 'Эндокринология', 4.5, 0),
+    ('E66.9', 'Ожирение неуточнённое', 'Эндокринология', 0.8, 8),
+    ('E03.9', 'Гипотиреоз неуточнённый', 'Эндокринология', 0.0, 3),
+    ('I10', 'Эссенциальная гипертензия', 'Кардиология', 0.0, 25),
+    ('I25.1', 'Атеросклеротическая болезнь сердца', 'Кардиология', 0.3, 12),
+    ('I48', 'Фибрилляция предсердий', 'Кардиология', 0.0, 6),
+    ('J45', 'Астма', 'Пульмонология', 0.0, 0),
+    ('K29.5', 'Хронический гастрит', 'Гастроэнтерология', 0.0, 0),
+]
+
+MEDICATIONS = [('Метформин', 500, 'мг', '2 раза в день'), ('Лизиноприл', 10, 'мг', '1 раз в день'),
+               ('Аторвастатин', 20, 'мг', '1 раз в день'), ('Инсулин гларгин', 12, 'ЕД', '1 раз в день'),
+               ('Бисопролол', 5, 'мг', '1 раз в день'), ('Омепразол', 20, 'мг', '2 раза в день')]
+SEVERITIES = ['лёгкая', 'средняя', 'тяжёлая']
+STATUSES = [StatusEnum.active.value, StatusEnum.completed.value, StatusEnum.cancelled.value]
+
+
+def clamp(value, low, high):
+    return max(low, min(high, value))
+
+
+def insert_rows(table, rows):
+    if not rows:
+        return
+    if is_sharded(table):
+        # Строки пациента пишутся пачками в файл его шарда
+        by_shard = {}
+        for row in rows:
+            by_shard.setdefault(shard_for(row['patient_id']), []).append(row)
+        for shard_id, shard_rows in by_shard.items():
+            stmt = table.insert()
+            if table.name in GLOBAL_ID_TABLES:
+                stmt = stmt.values(id=shard_row_id(table, shard_id))
+            db.session.execute(stmt, shard_rows, bind_arguments={'shard_id': shard_id})
+    else:
+        db.session.execute(table.insert(), rows)
+    rows.clear()
+
+
+def get_or_add(model, defaults=None, **lookup):
+    # Справочники могут уже быть в базе: берём существующую запись вместо нарушения уникальности
+    instance = db.session.query(model).filter_by(**lookup).first()
+    if instance is None:
+        instance = model(**lookup, **(defaults or {}))
+        db.session.add(instance)
+    return instance
+
+
+def generate_reference_data(rng):
+    specializations = [get_or_add(Specialization, name=n) for n in SPECIALIZATIONS]
+    departments = [get_or_add(Department, name=n) for n in DEPARTMENTS]
+
+    symptoms = []
+    for category_name, items in SYMPTOMS.items():
+        category = get_or_add(SymptomCategory, name=category_name)
+        for name, description in items:
+            symptoms.append(get_or_add(Symptom, {'description': description}, name=name, category=category))
+
+    diagnoses = [get_or_add(Diagnosis, {'name': name, 'category': category}, mkb10_code=code)
+                 for code, name, category, _, _ in DIAGNOSES]
+
+    db.session.flush()
+    return specializations, departments, symptoms, diagnoses
+
+
+def random_person(rng):
+    gender = rng.choice([GenderEnum.male, GenderEnum.female])
+    surname = rng.choice(SURNAMES)
+    patronim = rng.choice(PATRONIMS)
+    if gender == GenderEnum.female:
+        surname = surname.replace('ё', 'е') + 'а'
+        name = rng.choice(FEMALE_NAMES)
+        patronim = patronim + 'на' if patronim else None
+    else:
+        name = rng.choice(MALE_NAMES)
+        patronim = patronim + 'ич' if patronim else None
+    return gender, surname, name, patronim
+
+
+def generate_doctors(rng, count, specializations, departments, password_hash):
+    doctor_ids = []
+    for i in range(count):
+        _, surname, name, patronim = random_person(rng)
+        doctor = Doctor(
+            surname=surname,
+            name=name,
+            patronim=patronim,
+            specialization_id=rng.choice(specializations).id,
+            department_id=rng.choice(departments).id,
+            email=f'doctor{i}@synthetic.local',
+            phone=f'8{i:010d}'
+        )
+        db.session.add(doctor)
+        db.session.flush()
+        db.session.add(User(email=doctor.email, password_hash=password_hash, role=RoleEnum.doctor,
+                            is_active=True, is_verified=True, doctor_id=doctor.id))
+        doctor_ids.append(doctor.id)
+    db.session.flush()
+    return doctor_ids
+
+
+def generate_patients(rng, count, password_hash, batch_size):
+    patients, users = [], []
+    first_id = (db.session.query(db.func.max(Patient.id)).scalar() or 0) + 1
+    for i in range(count):
+        gender, surname, name, patronim = random_person(rng)
+        height = round(rng.gauss(178 if gender == GenderEnum.male else 165, 7), 1)
+        patients.append({
+            'id': first_id + i,
+            'surname': surname,
+            'name': name,
+            'patronim': patronim,
+            'gender': gender.name,
+            'birth_date': date(1940, 1, 1) + timedelta(days=rng.randrange(365 * 65)),
+            'city': rng.choice(CITIES),
+            'street': rng.choice(STREETS),
+            'building': str(rng.randint(1, 150)),
+            'email': f'patient{i}@synthetic.local',
+            'phone': f'7{i:010d}',
+            'height': height,
+            'weight': round(clamp(rng.gauss(75, 15), 40, 180), 1),
+            'created_at': BASE_DATE,
+            'updated_at': BASE_DATE
+        })
+        users.append({
+            'email': f'patient{i}@synthetic.local',
+            'password_hash': password_hash,
+            'role': RoleEnum.patient.name,
+            'is_active': True,
+            'is_verified': True,
+            'patient_id': first_id + i,
+            'created_at': BASE_DATE,
+            'updated_at': BASE_DATE
+        })
+        if len(patients) >= batch_size:
+            insert_rows(Patient.__table__, patients)
+            insert_rows(User.__table__, users)
+    insert_rows(Patient.__table__, patients)
+    insert_rows(User.__table__, users)
+    return list(range(first_id, first_id + count))
+
+
+def measurement_row(rng, patient_id, baseline, measured_at):
+    # Значения держим в пределах, которые пропускает trg_measurement_validation
+    systolic = int(clamp(rng.gauss(baseline['systolic'], 12), 70, 260))
+    diastolic = int(clamp(rng.gauss(systolic - baseline['pulse_pressure'], 6), 40, min(systolic, 160)))
+    if rng.random() < 0.01:
+        systolic = int(clamp(systolic + rng.randint(40, 70), 70, 290))
+    row = {
+        'patient_id': patient_id,
+        'glucose': round(clamp(rng.gauss(baseline['glucose'], 1.1), 1.5, 35), 1),
+        'systolic_bp': systolic,
+        'diastolic_bp': diastolic,
+        'pulse': int(clamp(rng.gauss(baseline['pulse'], 9), 35, 200)),
+        'weight': round(clamp(baseline['weight'] + rng.gauss(0, 0.8), 20, 400), 1),
+        'measured_at': measured_at,
+        'created_at': measured_at,
+        'updated_at': measured_at
+    }
+    # Часть пациентов измеряет только давление
+    if rng.random() < 0.2:
+        row['glucose'] = None
+        row['weight'] = None
+    return row
+
+
+def generate_patient_history(rng, patient_ids, doctor_ids, symptom_ids, diagnoses, options):
+    measurements, consultations, complaints, prescriptions, patient_diagnoses = [], [], [], [], []
+    batch_size = options.batch_size
+    history_days = options.history_days
+
+    for patient_id in patient_ids:
+        baseline = {
+            'glucose': rng.gauss(5.4, 0.5),
+            'systolic': rng.gauss(122, 10),
+            'pulse_pressure': rng.gauss(42, 5),
+            'pulse': rng.gauss(72, 7),
+            'weight': clamp(rng.gauss(75, 15), 40, 180)
+        }
+
+        for diagnosis in rng.sample(diagnoses, rng.choice([0, 0, 1, 1, 2])):
+            glucose_shift, systolic_shift = next((g, s) for code, _, _, g, s in DIAGNOSES
+                                                 if code == diagnosis.mkb10_code)
+            baseline['glucose'] += glucose_shift
+            baseline['systolic'] += systolic_shift
+            patient_diagnoses.append({
+                'patient_id': patient_id,
+                'diagnosis_id': diagnosis.id,
+                'diagnosed_at': BASE_DATE - timedelta(days=rng.randrange(history_days)),
+                'created_at': BASE_DATE,
+                'updated_at': BASE_DATE
+            })
+
+        patient_doctors = rng.sample(doctor_ids, min(len(doctor_ids), rng.randint(1, 3)))
+        for _ in range(max(1, int(rng.expovariate(1 / options.consultations_per_patient)))):
+            consultation_date = BASE_DATE - timedelta(days=rng.randrange(history_days), hours=rng.randrange(8, 18))
+            consultations.append({
+                'patient_id': patient_id,
+                'doctor_id': rng.choice(patient_doctors),
+                'consultation_date': consultation_date,
+                'notes': 'Плановый осмотр',
+                'created_at': consultation_date,
+                'updated_at': consultation_date
+            })
+
+        count = int(rng.expovariate(1 / options.measurements_per_patient)) if options.measurements_per_patient else 0
+        if count:
+            step = history_days * 86400 / count
+            start = BASE_DATE - timedelta(days=history_days)
+            for i in range(count):
+                measured_at = start + timedelta(seconds=int(i * step + rng.random() * step))
+                measurements.append(measurement_row(rng, patient_id, baseline, measured_at))
+                if len(measurements) >= batch_size:
+                    insert_rows(Measurement.__table__, measurements)
+                    db.session.commit()
+
+        for _ in range(int(rng.expovariate(1 / options.complaints_per_patient))
+                       if options.complaints_per_patient else 0):
+            complaint_date = BASE_DATE - timedelta(days=rng.randrange(history_days))
+            complaints.append({
+                'patient_id': patient_id,
+                'symptom_id': rng.choice(symptom_ids),
+                'complaint_date': complaint_date,
+                'severity': rng.choice(SEVERITIES),
+                'description': None,
+                'created_at': complaint_date,
+                'updated_at': complaint_date
+            })
+
+        for _ in range(int(rng.expovariate(1 / options.prescriptions_per_patient))
+                       if options.prescriptions_per_patient else 0):
+            medication, quantity, dose_unit, frequency = rng.choice(MEDICATIONS)
+            start_date = BASE_DATE - timedelta(days=rng.randrange(history_days))
+            duration = rng.choice([14, 30, 60, 90, 180])
+            prescriptions.append({
+                'patient_id': patient_id,
+                'doctor_id': rng.choice(patient_doctors),
+                'medication_name': medication,
+                'quantity': quantity,
+                'dose_unit': dose_unit,
+                'frequency': frequency,
+                'duration_days': duration,
+                'start_date': start_date,
+                'end_date': start_date + timedelta(days=duration),
+                'instructions': None,
+                'status': rng.choice(STATUSES),
+                'created_at': start_date,
+                'updated_at': start_date
+            })
+
+        if len(consultations) + len(complaints) + len(prescriptions) + len(patient_diagnoses) >= batch_size:
+            insert_rows(Consultation.__table__, consultations)
+            insert_rows(Complaint.__table__, complaints)
+            insert_rows(Prescription.__table__, prescriptions)
+            insert_rows(PatientDiagnosis.__table__, patient_diagnoses)
+            db.session.commit()
+
+    insert_rows(Measurement.__table__, measurements)
+    insert_rows(Consultation.__table__, consultations)
+    insert_rows(Complaint.__table__, complaints)
+    insert_rows(Prescription.__table__, prescriptions)
+    insert_rows(PatientDiagnosis.__table__, patient_diagnoses)
+    db.session.commit()
+
+
+def generate(options):
+    # Синтетические пользователи не должны смешиваться с существующими: их email и телефоны совпали бы
+    if db.session.query(User.id).first() is not None:
+        raise SystemExit('В базе уже есть пользователи, укажите --database с новым файлом')
+
+    rng = random.Random(options.seed)
+    # Один хеш на всех пользователей: хешировать пароль каждого (scrypt, PBKDF2) было бы в разы медленнее
+    password_hash = generate_password_hash(options.password, method=Config.PASSWORD_HASH_METHOD)
+
+    specializations, departments, symptoms, diagnoses = generate_reference_data(rng)
+    doctor_ids = generate_doctors(rng, options.doctors, specializations, departments, password_hash)
+    db.session.commit()
+
+    patient_ids = generate_patients(rng, options.patients, password_hash, options.batch_size)
+    db.session.commit()
+
+    generate_patient_history(rng, patient_ids, doctor_ids, [s.id for s in symptoms], diagnoses, options)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Генерация синтетических данных для нагрузочного тестирования')
+    parser.add_argument('--database', help='URI базы данных (по умолчанию из Config)')
+    parser.add_argument('--shards', type=int, help='Число шардов пациентов (по умолчанию из Config)')
+    parser.add_argument('--shard-database', help='Шаблон URI шардов с {} на месте номера')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--patients', type=int, default=1000)
+    parser.add_argument('--doctors', type=int, default=50)
+    parser.add_argument('--measurements-per-patient', type=float, default=500)
+    parser.add_argument('--consultations-per-patient', type=float, default=6)
+    parser.add_argument('--complaints-per-patient', type=float, default=4)
+    parser.add_argument('--prescriptions-per-patient', type=float, default=3)
+    parser.add_argument('--history-days', type=int, default=3 * 365)
+    parser.add_argument('--batch-size', type=int, default=10000)
+    parser.add_argument('--password', default='default123')
+    return parser
+
+
+def make_config(database=None, shards=None, shard_database=None):
+    overrides = {}
+    if database:
+        overrides['SQLALCHEMY_DATABASE_URI'] = database
+    if shards is not None:
+        overrides['SHARD_COUNT'] = shards
+    if shard_database:
+        overrides['SHARD_DATABASE_URI'] = shard_database
+    if not overrides:
+        return Config
+    return type('GeneratorConfig', (Config,), overrides)
+
+
+def count_rows(model):
+    stmt = select(func.count()).select_from(model.__table__)
+    # Общие таблицы видны с каждого шарда через ATTACH, поэтому обходим шарды только для таблиц пациента
+    if is_sharded(model.__table__):
+        return sum(count for (count,) in fan_out_rows(stmt))
+    return db.session.execute(stmt).scalar()
+
+
+def main():
+    options = build_parser().parse_args()
+    app = create_app(make_config(options.database, options.shards, options.shard_database))
+    with app.app_context():
+        generate(options)
+
+        print("Генерация данных завершена")
+        print(f"Пациентов: {count_rows(Patient)}")
+        print(f"Врачей: {count_rows(Doctor)}")
+        print(f"Консультаций: {count_rows(Consultation)}")
+        print(f"Измерений: {count_rows(Measurement)}")
+        print(f"Назначений: {count_rows(Prescription)}")
+        print(f"Жалоб: {count_rows(Complaint)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,205 @@
+import argparse
+import zlib
+from collections import namedtuple
+from datetime import datetime, timedelta
+from itertools import groupby
+
+import numpy as np
+from sqlalchemy import select, func
+
+from app import create_app, db
+from config import Config
+from models import Measurement, MeasurementBlock, Patient
+from sharding import fan_out, fan_out_by_patient, fan_out_rows, shard_count, shard_for
+
+BLOCK_FORMAT = 1
+NULL_INT = -1
+DELETE_CHUNK = 500
+
+# Порядок и типы столбцов в блоке; id и measured_at хранятся разностями, так они лучше сжимаются
+BLOCK_COLUMNS = (
+    ('id', '<i8'),
+    ('measured_at', '<i8'),
+    ('glucose', '<f8'),
+    ('systolic_bp', '<i2'),
+    ('diastolic_bp', '<i2'),
+    ('pulse', '<i2'),
+    ('weight', '<f8'),
+)
+FLOAT_COLUMNS = ('glucose', 'weight')
+DELTA_COLUMNS = ('id', 'measured_at')
+
+ArchivedMeasurement = namedtuple('ArchivedMeasurement', ['id', 'patient_id', 'glucose', 'systolic_bp', 'diastolic_bp',
+                                                         'pulse', 'weight', 'measured_at'])
+
+MEASUREMENT_FIELDS = (Measurement.id, Measurement.patient_id, Measurement.glucose, Measurement.systolic_bp,
+                      Measurement.diastolic_bp, Measurement.pulse, Measurement.weight, Measurement.measured_at)
+
+
+def encode_block(rows):
+    columns = []
+    for name, dtype in BLOCK_COLUMNS:
+        if name == 'measured_at':
+            values = np.array([r.measured_at for r in rows], dtype='datetime64[us]').astype(dtype)
+        elif name in FLOAT_COLUMNS:
+            values = np.array([getattr(r, name) for r in rows], dtype=dtype)
+        else:
+            values = np.array([NULL_INT if getattr(r, name) is None else getattr(r, name) for r in rows], dtype=dtype)
+        if name in DELTA_COLUMNS:
+            values = np.diff(values, prepend=values.dtype.type(0))
+        columns.append(values.tobytes())
+    return bytes([BLOCK_FORMAT]) + zlib.compress(b''.join(columns))
+
+
+def decode_block_arrays(payload, row_count):
+    if payload[0] != BLOCK_FORMAT:
+        raise ValueError(f'Unsupported measurement block format: {payload[0]}')
+    raw = zlib.decompress(payload[1:])
+    arrays, offset = {}, 0
+    for name, dtype in BLOCK_COLUMNS:
+        values = np.frombuffer(raw, dtype=dtype, count=row_count, offset=offset)
+        offset += values.nbytes
+        if name in DELTA_COLUMNS:
+            values = np.cumsum(values)
+        arrays[name] = values
+    return arrays
+
+
+def decode_block(block):
+    arrays = decode_block_arrays(block.payload, block.row_count)
+    measured_at = arrays['measured_at'].astype('datetime64[us]').tolist()
+
+    def value(name, i):
+        v = arrays[name][i]
+        if name in FLOAT_COLUMNS:
+            return None if np.isnan(v) else float(v)
+        return None if v == NULL_INT else int(v)
+
+    return [ArchivedMeasurement(int(arrays['id'][i]), block.patient_id, value('glucose', i), value('systolic_bp', i),
+                                value('diastolic_bp', i), value('pulse', i), value('weight', i), measured_at[i])
+            for i in range(block.row_count)]
+
+
+def latest_measurements(patient_id, limit):
+    rows = db.session.query(Measurement).filter_by(patient_id=patient_id).order_by(
+        Measurement.measured_at.desc()).limit(limit).all()
+    if len(rows) == limit:
+        # Блоки нужны, только если в них есть что-то новее самой старой строки из таблицы
+        # (задним числом добавленные измерения могут оказаться старше архива)
+        blocks = db.session.query(MeasurementBlock).filter(
+            MeasurementBlock.patient_id == patient_id,
+            MeasurementBlock.last_measured_at > rows[-1].measured_at).all()
+    else:
+        blocks = db.session.query(MeasurementBlock).filter_by(patient_id=patient_id).order_by(
+            MeasurementBlock.last_measured_at.desc()).all()
+
+    result = list(rows)
+    for block in sorted(blocks, key=lambda b: b.last_measured_at, reverse=True):
+        if len(result) >= limit and block.last_measured_at <= result[limit - 1].measured_at:
+            break
+        result.extend(decode_block(block))
+        result.sort(key=lambda m: m.measured_at, reverse=True)
+    return result[:limit]
+
+
+def measurements_in_range(patient_id, date_from, date_to):
+    rows = db.session.query(Measurement).filter(
+        Measurement.patient_id == patient_id,
+        Measurement.measured_at >= date_from,
+        Measurement.measured_at < date_to
+    ).all()
+    blocks = db.session.query(MeasurementBlock).filter(
+        MeasurementBlock.patient_id == patient_id,
+        MeasurementBlock.last_measured_at >= date_from,
+        MeasurementBlock.first_measured_at < date_to
+    ).all()
+    result = list(rows)
+    for block in blocks:
+        result.extend(m for m in decode_block(block) if date_from <= m.measured_at < date_to)
+    result.sort(key=lambda m: m.measured_at, reverse=True)
+    return result
+
+
+def latest_archived_measurements(patient_ids):
+    # Последнее измерение из самого свежего блока — для пациентов, у которых в таблице не осталось строк
+    newest_block = select(MeasurementBlock.id).where(MeasurementBlock.patient_id == Patient.id).order_by(
+        MeasurementBlock.last_measured_at.desc()).limit(1).correlate(Patient).scalar_subquery()
+    blocks = fan_out_by_patient(patient_ids, lambda ids: select(
+        MeasurementBlock.patient_id, MeasurementBlock.row_count, MeasurementBlock.payload
+    ).where(MeasurementBlock.id.in_(select(newest_block).where(Patient.id.in_(ids)))))
+    return {block.patient_id: max(decode_block(block), key=lambda m: m.measured_at) for block in blocks}
+
+
+def _month(measured_at):
+    return measured_at.date().replace(day=1)
+
+
+def _compact_patient(patient_id, cutoff, keep_id):
+    rows = db.session.query(*MEASUREMENT_FIELDS).filter(
+        Measurement.patient_id == patient_id,
+        Measurement.measured_at < cutoff,
+        Measurement.id != keep_id
+    ).order_by(Measurement.measured_at).all()
+    if not rows:
+        return 0
+
+    months = {_month(r.measured_at) for r in rows}
+    existing = {b.month: b for b in db.session.query(MeasurementBlock).filter(
+        MeasurementBlock.patient_id == patient_id, MeasurementBlock.month.in_(months))}
+
+    for month, month_rows in groupby(rows, key=lambda r: _month(r.measured_at)):
+        month_rows = list(month_rows)
+        block = existing.get(month)
+        if block is None:
+            block = MeasurementBlock(patient_id=patient_id, month=month)
+            db.session.add(block)
+        else:
+            month_rows = sorted(decode_block(block) + month_rows, key=lambda r: r.measured_at)
+        block.payload = encode_block(month_rows)
+        block.row_count = len(month_rows)
+        block.first_measured_at = month_rows[0].measured_at
+        block.last_measured_at = month_rows[-1].measured_at
+
+    # Удаляем строго прочитанные строки: измерение, добавленное задним числом за это время, не потеряется
+    ids = [r.id for r in rows]
+    for i in range(0, len(ids), DELETE_CHUNK):
+        db.session.query(Measurement).filter(
+            Measurement.patient_id == patient_id, Measurement.id.in_(ids[i:i + DELETE_CHUNK])
+        ).delete(synchronize_session=False)
+    return len(rows)
+
+
+def compact_measurements(older_than_days, now=None):
+    now = now or datetime.utcnow()
+    # Граница выравнивается на начало месяца, чтобы в таблице не оставались хвосты уже упакованных месяцев
+    cutoff = (now - timedelta(days=older_than_days)).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    patient_ids = sorted(pid for (pid,) in fan_out_rows(select(Measurement.patient_id).where(
+        Measurement.measured_at < cutoff).distinct()))
+    # Строка с наибольшим id остаётся в таблице: id без AUTOINCREMENT, и после её удаления SQLite
+    # выдал бы тот же id следующему измерению
+    keep_ids = [rows[0][0] for rows in fan_out(select(func.max(Measurement.id)))]
+
+    moved = 0
+    for patient_id in patient_ids:
+        moved += _compact_patient(patient_id, cutoff, keep_ids[shard_for(patient_id) if shard_count() else 0])
+        db.session.commit()
+    return len(patient_ids), moved
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Перенос старых измерений в помесячные сжатые блоки')
+    parser.add_argument('--database', help='URI базы данных (по умолчанию из Config)')
+    parser.add_argument('--older-than-days', type=int, default=Config.MEASUREMENT_ARCHIVE_AFTER_DAYS)
+    options = parser.parse_args()
+
+    config = type('ArchiveConfig', (Config,), {'SQLALCHEMY_DATABASE_URI': options.database}) \
+        if options.database else Config
+    app = create_app(config)
+    with app.app_context():
+        patients, moved = compact_measurements(options.older_than_days)
+        print(f"Пациентов обработано: {patients}")
+        print(f"Измерений перенесено в блоки: {moved}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,259 @@
+import hmac
+import logging
+import re
+import threading
+import time
+from bisect import bisect_left
+
+from flask import Response, current_app, request
+from sqlalchemy import event
+
+from sharding import share_request_state
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 4, 5, 6, 8, 10, 15, 20, 50, 100)
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_whitespace = re.compile(r'\s+')
+
+
+class _Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def merge(self, other):
+        for i, c in enumerate(other.counts):
+            self.counts[i] += c
+        self.sum += other.sum
+        self.count += other.count
+
+
+# Статистика одного потока: пишет в неё только сам поток, поэтому блокировки на горячем пути не нужны
+class _ThreadStats:
+    def __init__(self, thread=None):
+        self.thread = thread
+        self.requests = {}
+        self.latency = {}
+        self.queries = {}
+        self.db_time = {}
+        self.slow = {}
+
+    def merge(self, other):
+        for key, value in list(other.requests.items()):
+            self.requests[key] = self.requests.get(key, 0) + value
+        for target, source, buckets in ((self.latency, other.latency, LATENCY_BUCKETS),
+                                        (self.queries, other.queries, QUERY_COUNT_BUCKETS),
+                                        (self.db_time, other.db_time, LATENCY_BUCKETS)):
+            for key, hist in list(source.items()):
+                target.setdefault(key, _Histogram(buckets)).merge(hist)
+        for key, (count, total) in list(other.slow.items()):
+            current = self.slow.get(key, (0, 0.0))
+            self.slow[key] = (current[0] + count, current[1] + total)
+
+
+# Запросы fan_out пишут в состояние параллельно из нескольких потоков: list.append атомарен, а += нет
+class _RequestState:
+    __slots__ = ('started', 'query_times', 'recorded')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.query_times = []
+        self.recorded = False
+
+
+class Metrics:
+    def __init__(self, app=None, engines=()):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._threads = []
+        self._retired = _ThreadStats()
+        self.slow_query_seconds = None
+        self.slow_query_limit = 100
+        if app is not None:
+            self.init_app(app, engines)
+
+    def init_app(self, app, engines):
+        # Выключенные метрики не вешают ни одного обработчика, т.е. ничего не стоят
+        if not app.config.get('METRICS_ENABLED', False):
+            return
+        if not app.config.get('METRICS_TOKEN'):
+            raise ValueError('METRICS_ENABLED requires METRICS_TOKEN')
+        self.slow_query_seconds = app.config.get('METRICS_SLOW_QUERY_MS', 100) / 1000
+        self.slow_query_limit = app.config.get('METRICS_SLOW_QUERY_LIMIT', 100)
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        app.add_url_rule(app.config.get('METRICS_PATH', '/metrics'), 'metrics', self._metrics_view)
+        for engine in engines:
+            event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+        share_request_state(self._local, 'request')
+        app.extensions['metrics'] = self
+
+    def _stats(self):
+        stats = getattr(self._local, 'stats', None)
+        if stats is None:
+            stats = self._local.stats = _ThreadStats(threading.current_thread())
+            with self._lock:
+                self._fold_dead_threads()
+                self._threads.append(stats)
+        return stats
+
+    def _fold_dead_threads(self):
+        # Потоки werkzeug живут один запрос; их статистику сворачиваем, чтобы список не рос
+        alive = []
+        for stats in self._threads:
+            if stats.thread.is_alive():
+                alive.append(stats)
+            else:
+                self._retired.merge(stats)
+        self._threads = alive
+
+    def _before_request(self):
+        self._local.request = _RequestState()
+
+    def _after_request(self, response):
+        self._record(response.status_code)
+        return response
+
+    def _teardown_request(self, exc):
+        # after_request не вызывается при необработанном исключении
+        self._record(500)
+        self._local.request = None
+
+    def _record(self, status):
+        state = getattr(self._local, 'request', None)
+        if state is None or state.recorded:
+            return
+        state.recorded = True
+        elapsed = time.perf_counter() - state.started
+        endpoint = request.endpoint or 'unmatched'
+        stats = self._stats()
+
+        key = (endpoint, request.method, status)
+        stats.requests[key] = stats.requests.get(key, 0) + 1
+        hist = stats.latency.get(endpoint)
+        if hist is None:
+            hist = stats.latency[endpoint] = _Histogram(LATENCY_BUCKETS)
+        hist.observe(elapsed)
+        hist = stats.queries.get(endpoint)
+        if hist is None:
+            hist = stats.queries[endpoint] = _Histogram(QUERY_COUNT_BUCKETS)
+        hist.observe(len(state.query_times))
+        hist = stats.db_time.get(endpoint)
+        if hist is None:
+            hist = stats.db_time[endpoint] = _Histogram(LATENCY_BUCKETS)
+        hist.observe(sum(state.query_times))
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        context._metrics_started = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - context._metrics_started
+        state = getattr(self._local, 'request', None)
+        if state is not None:
+            state.query_times.append(elapsed)
+        if elapsed >= self.slow_query_seconds:
+            self._record_slow(statement, parameters, executemany, elapsed)
+
+    def _record_slow(self, statement, parameters, executemany, elapsed):
+        statement = _whitespace.sub(' ', statement).strip()
+        shape = parameter_shape(parameters, executemany)
+        logger.warning('Slow query (%.1f ms): %s params=%s', elapsed * 1000, statement, shape)
+
+        stats = self._stats()
+        key = (statement[:200], shape)
+        if key not in stats.slow and len(stats.slow) >= self.slow_query_limit:
+            key = ('other', '')
+        count, total = stats.slow.get(key, (0, 0.0))
+        stats.slow[key] = (count + 1, total + elapsed)
+
+    def collect(self):
+        total = _ThreadStats()
+        with self._lock:
+            self._fold_dead_threads()
+            alive = list(self._threads)
+            total.merge(self._retired)
+        for stats in alive:
+            total.merge(stats)
+        return total
+
+    def render(self):
+        stats = self.collect()
+        lines = [
+            '# HELP medsystem_http_requests_total HTTP requests by endpoint, method and status.',
+            '# TYPE medsystem_http_requests_total counter'
+        ]
+        for (endpoint, method, status), value in sorted(stats.requests.items()):
+            lines.append(f'medsystem_http_requests_total{_labels(endpoint=endpoint, method=method, status=status)}'
+                         f' {value}')
+
+        _render_histogram(lines, 'medsystem_http_request_duration_seconds', 'Request latency by endpoint.',
+                          stats.latency)
+        _render_histogram(lines, 'medsystem_db_queries_per_request', 'SQL statements executed per request.',
+                          stats.queries)
+        _render_histogram(lines, 'medsystem_db_time_per_request_seconds', 'Time spent in SQL per request.',
+                          stats.db_time)
+
+        lines.append('# HELP medsystem_db_slow_queries_total Statements slower than the slow query threshold.')
+        lines.append('# TYPE medsystem_db_slow_queries_total counter')
+        for (statement, shape), (count, _) in sorted(stats.slow.items()):
+            lines.append(f'medsystem_db_slow_queries_total{_labels(statement=statement, params=shape)} {count}')
+        lines.append('# HELP medsystem_db_slow_query_seconds_total Time spent in slow statements.')
+        lines.append('# TYPE medsystem_db_slow_query_seconds_total counter')
+        for (statement, shape), (_, total) in sorted(stats.slow.items()):
+            lines.append(f'medsystem_db_slow_query_seconds_total{_labels(statement=statement, params=shape)} '
+                         f'{total:.6f}')
+        return '\n'.join(lines) + '\n'
+
+    def _metrics_view(self):
+        expected = f"Bearer {current_app.config['METRICS_TOKEN']}"
+        if not hmac.compare_digest(request.headers.get('Authorization', '').encode(), expected.encode()):
+            return Response('Unauthorized\n', status=401, mimetype='text/plain',
+                            headers={'WWW-Authenticate': 'Bearer'})
+        return Response(self.render(), mimetype=PROMETHEUS_CONTENT_TYPE)
+
+
+def parameter_shape(parameters, executemany=False):
+    if executemany:
+        parameters = list(parameters)
+        return f'{len(parameters)}x{parameter_shape(parameters[0]) if parameters else "()"}'
+    if isinstance(parameters, dict):
+        return '{' + ', '.join(f'{k}: {type(v).__name__}' for k, v in parameters.items()) + '}'
+    if isinstance(parameters, (list, tuple)):
+        return '(' + ', '.join(type(v).__name__ for v in parameters) + ')'
+    return type(parameters).__name__
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(**labels):
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + '}'
+
+
+def _render_histogram(lines, name, help_text, histograms):
+    lines.append(f'# HELP {name} {help_text}')
+    lines.append(f'# TYPE {name} histogram')
+    for endpoint, hist in sorted(histograms.items()):
+        cumulative = 0
+        for bound, count in zip(hist.buckets, hist.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{_labels(endpoint=endpoint, le=bound)} {cumulative}')
+        lines.append(f'{name}_bucket{_labels(endpoint=endpoint, le="+Inf")} {hist.count}')
+        lines.append(f'{name}_sum{_labels(endpoint=endpoint)} {hist.sum:.6f}')
+        lines.append(f'{name}_count{_labels(endpoint=endpoint)} {hist.count}')
@@ -4,10 +4,12 @@ from .user import User
 from .patient import Patient
 from .doctor import Doctor
 from .diagnosis import Diagnosis, PatientDiagnosis
-from .measurement import Measurement
+from .measurement import Measurement, MeasurementBlock
 from .prescription import Prescription
 from .complaint import Complaint
 from .consultation import Consultation
+from .doctor_patient import DoctorPatient
+from .trend import PatientTrend
 from .reference_data import Specialization, Department, SymptomCategory, Symptom
 
 __all__ = [
@@ -15,6 +17,6 @@ __all__ = [
     'GenderEnum', 'StatusEnum', 'RoleEnum',
     'User', 'Patient', 'Doctor',
     'Diagnosis', 'PatientDiagnosis',
-    'Measurement', 'Prescription', 'Complaint', 'Consultation',
+    'Measurement', 'MeasurementBlock', 'Prescription', 'Complaint', 'Consultation', 'DoctorPatient', 'PatientTrend',
     'Specialization', 'Department', 'SymptomCategory', 'Symptom'
 ]
\ No newline at end of file
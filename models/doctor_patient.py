@@ -0,0 +1,22 @@
+from sqlalchemy import Column, Integer, ForeignKey, DateTime, Index, UniqueConstraint
+from sqlalchemy.orm import relationship
+from .base import Base, BaseModel
+
+
+# Связь врач–пациент, поддерживается триггерами на consultations (см. init_db_business_logic)
+class DoctorPatient(Base, BaseModel):
+    __tablename__ = "doctor_patients"
+
+    doctor_id = Column(ForeignKey('doctors.id'), nullable=False)
+    patient_id = Column(ForeignKey('patients.id'), nullable=False, index=True)
+    first_consultation_at = Column(DateTime, nullable=False)
+    last_consultation_at = Column(DateTime, nullable=False)
+    consultations_count = Column(Integer, nullable=False, default=0)
+
+    doctor = relationship("Doctor")
+    patient = relationship("Patient")
+
+    __table_args__ = (
+        UniqueConstraint('doctor_id', 'patient_id', name='uq_doctor_patients_doctor_patient'),
+        Index('idx_doctor_patients_doctor_last_visit', 'doctor_id', 'last_consultation_at', 'patient_id'),
+    )
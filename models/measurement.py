@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Float, Integer, ForeignKey, DateTime, Index
+from sqlalchemy import Column, Float, Integer, ForeignKey, DateTime, Date, LargeBinary, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 from .base import Base, BaseModel
 from datetime import datetime
@@ -19,4 +19,23 @@ class Measurement(Base, BaseModel):
 
     __table_args__ = (
         Index('idx_measurements_patient_date', 'patient_id', 'measured_at'),
+    )
+
+
+# Архивные измерения пациента за месяц, упакованные в один сжатый блок (см. measurement_archive.py)
+class MeasurementBlock(Base, BaseModel):
+    __tablename__ = "measurement_blocks"
+
+    patient_id = Column(ForeignKey('patients.id'), nullable=False)
+    month = Column(Date, nullable=False)
+    first_measured_at = Column(DateTime, nullable=False)
+    last_measured_at = Column(DateTime, nullable=False)
+    row_count = Column(Integer, nullable=False)
+    payload = Column(LargeBinary, nullable=False)
+
+    patient = relationship("Patient")
+
+    __table_args__ = (
+        UniqueConstraint('patient_id', 'month', name='uq_measurement_blocks_patient_month'),
+        Index('idx_measurement_blocks_patient_last', 'patient_id', 'last_measured_at'),
     )
\ No newline at end of file
@@ -0,0 +1,29 @@
+from sqlalchemy import Column, Integer, Float, ForeignKey, DateTime
+from sqlalchemy.orm import relationship
+from .base import Base, BaseModel
+
+
+# Экспоненциально сглаженные среднее и дисперсия показателей пациента, обновляются при каждом измерении
+class PatientTrend(Base, BaseModel):
+    __tablename__ = "patient_trends"
+
+    patient_id = Column(ForeignKey('patients.id'), unique=True, nullable=False, index=True)
+    last_measured_at = Column(DateTime, nullable=True)
+
+    glucose_count = Column(Integer, nullable=False, default=0)
+    glucose_mean = Column(Float, nullable=True)
+    glucose_var = Column(Float, nullable=True)
+    systolic_bp_count = Column(Integer, nullable=False, default=0)
+    systolic_bp_mean = Column(Float, nullable=True)
+    systolic_bp_var = Column(Float, nullable=True)
+    diastolic_bp_count = Column(Integer, nullable=False, default=0)
+    diastolic_bp_mean = Column(Float, nullable=True)
+    diastolic_bp_var = Column(Float, nullable=True)
+    pulse_count = Column(Integer, nullable=False, default=0)
+    pulse_mean = Column(Float, nullable=True)
+    pulse_var = Column(Float, nullable=True)
+    weight_count = Column(Integer, nullable=False, default=0)
+    weight_mean = Column(Float, nullable=True)
+    weight_var = Column(Float, nullable=True)
+
+    patient = relationship("Patient")
@@ -0,0 +1,27 @@
+import base64
+import json
+
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values, ensure_ascii=False).encode()).decode()
+
+
+def decode_cursor(cursor, types):
+    # types — ожидаемые типы значений ключа сортировки; курсор другой формы отклоняется, а не попадает в SQL
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+    if not isinstance(values, list) or len(values) != len(types) or not all(
+            isinstance(v, t) and not isinstance(v, bool) for v, t in zip(values, types)):
+        raise ValueError('Invalid cursor')
+    return values
+
+
+def parse_limit(value, default=50, maximum=200):
+    if value is None:
+        return default
+    limit = int(value)
+    if limit < 1:
+        raise ValueError('limit must be positive')
+    return min(limit, maximum)
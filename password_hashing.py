@@ -0,0 +1,73 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+
+class HashingBusy(Exception):
+    pass
+
+
+# Хеширование паролей (scrypt или PBKDF2) в отдельном пуле с ограниченной параллельностью:
+# всплеск логинов не занимает все ядра, а запросы сверх лимита быстро получают отказ
+class PasswordHasher:
+    def __init__(self, app=None):
+        self.method = None
+        self.canonical_method = None
+        self.deprecated = ()
+        self.queue_timeout = None
+        self._executor = None
+        self._slots = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        workers = app.config.get('PASSWORD_HASH_WORKERS', 2)
+        self.method = app.config.get('PASSWORD_HASH_METHOD', 'scrypt')
+        # werkzeug записывает в хеш развёрнутые параметры (scrypt -> scrypt:32768:8:1), сравниваем именно с ними
+        self.canonical_method = _split_method(generate_password_hash('', method=self.method))
+        self.deprecated = tuple(app.config.get('PASSWORD_HASH_DEPRECATED', ()))
+        self.queue_timeout = app.config.get('PASSWORD_HASH_QUEUE_TIMEOUT', 2.0)
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+        self._slots = threading.BoundedSemaphore(workers)
+        app.extensions['password_hasher'] = self
+
+    def _run(self, fn, *args, **kwargs):
+        # Ждём свободного слота не дольше queue_timeout, иначе отказываем сразу
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            raise HashingBusy('Password hashing is saturated, retry later')
+        try:
+            future = self._executor.submit(fn, *args, **kwargs)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future.result()
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, method=self.method)
+
+    def check(self, pwhash, password):
+        return self._run(check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash):
+        # Перехешируем только вверх: устаревшее семейство из списка или то же семейство с более слабыми параметрами.
+        # Хеш другого, не устаревшего семейства не трогаем, даже если оно отличается от настроенного
+        family, params = _split_method(pwhash)
+        target_family, target_params = self.canonical_method
+        if family != target_family:
+            return family in self.deprecated
+        if len(params) != len(target_params):
+            return False
+        if family == 'pbkdf2':
+            digest, iterations = params
+            target_digest, target_iterations = target_params
+            return digest == target_digest and iterations < target_iterations
+        return params != target_params and all(p <= t for p, t in zip(params, target_params))
+
+
+def _split_method(pwhash):
+    family, *params = pwhash.split('$', 1)[0].split(':')
+    return family, tuple(int(p) if p.isdigit() else p for p in params)
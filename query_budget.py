@@ -0,0 +1,92 @@
+import logging
+import threading
+import traceback
+
+from flask import current_app, request
+from sqlalchemy import event
+
+from sharding import share_request_state, shard_count
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def query_budget(limit, fan_outs=0):
+    # Объявляет максимальное число SQL-запросов, которое может выполнить эндпоинт.
+    # fan_outs — сколько из них идут через sharding.fan_out: при шардировании каждый выполняется на всех шардах
+    def decorator(view):
+        view.query_budget = limit
+        view.query_budget_fan_outs = fan_outs
+        return view
+    return decorator
+
+
+class _BudgetState:
+    __slots__ = ('endpoint', 'limit', 'statements', 'stack')
+
+    def __init__(self, endpoint, limit):
+        self.endpoint = endpoint
+        self.limit = limit
+        self.statements = []
+        self.stack = None
+
+
+class QueryBudget:
+    def __init__(self, app=None, engines=()):
+        self._local = threading.local()
+        self.mode = 'off'
+        if app is not None:
+            self.init_app(app, engines)
+
+    def init_app(self, app, engines):
+        mode = app.config.get('QUERY_BUDGET_MODE', 'off')
+        if mode not in ('off', 'warn', 'raise'):
+            raise ValueError(f'Unknown QUERY_BUDGET_MODE: {mode}')
+        self.mode = mode
+        if mode == 'off':
+            return
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        for engine in engines:
+            event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+        share_request_state(self._local, 'state')
+        app.extensions['query_budget'] = self
+
+    def _before_request(self):
+        view = current_app.view_functions.get(request.endpoint)
+        limit = getattr(view, 'query_budget', None)
+        if limit is not None and shard_count():
+            limit += getattr(view, 'query_budget_fan_outs', 0) * (shard_count() - 1)
+        self._local.state = _BudgetState(request.endpoint, limit) if limit is not None else None
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        state = getattr(self._local, 'state', None)
+        if state is None:
+            return
+        state.statements.append(statement)
+        # Стек снимаем только для первого запроса сверх бюджета, чтобы не платить за него в норме
+        if state.stack is None and len(state.statements) > state.limit:
+            state.stack = ''.join(traceback.format_list(
+                [frame for frame in traceback.extract_stack()[:-1] if 'site-packages' not in frame.filename]))
+
+    def _after_request(self, response):
+        state = getattr(self._local, 'state', None)
+        self._local.state = None
+        if state is None or len(state.statements) <= state.limit:
+            return response
+
+        message = (f'{state.endpoint} executed {len(state.statements)} queries, budget is {state.limit}\n'
+                   + '\n'.join(f'  {i}: {s}' for i, s in enumerate(state.statements, 1))
+                   + f'\nFirst statement over budget issued from:\n{state.stack}')
+        if self.mode == 'raise':
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
+        return response
+
+    def _teardown_request(self, exc):
+        self._local.state = None
@@ -1,21 +1,42 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import create_access_token, create_refresh_token, jwt_required, get_jwt_identity
-from werkzeug.security import generate_password_hash, check_password_hash
-from app import db
-from models import User, Patient, Doctor, Measurement, Prescription, Complaint, Consultation, Symptom
+from sqlalchemy import select, tuple_
+from datetime import date, datetime, time, timedelta
+import math
+from app import db, password_hasher
+from password_hashing import HashingBusy
+import analytics
+import measurement_archive
+import sharding
+import trends
+from query_budget import query_budget
+from pagination import encode_cursor, decode_cursor, parse_limit
+from models import User, Patient, Doctor, Measurement, Prescription, Complaint, Consultation, DoctorPatient, \
+    PatientTrend, Symptom
 
 bp = Blueprint('api', __name__)
 
+MEASUREMENT_TYPES = {'glucose': float, 'systolic_bp': int, 'diastolic_bp': int, 'pulse': int, 'weight': float}
+
+# Форма курсора для каждого порядка сортировки списка пациентов врача
+CURSOR_TYPES = {'surname': (str, str, int), 'last_visit': (str, int)}
+
 
 @bp.route('/auth/register', methods=['POST'])
+@query_budget(3)
 def register():
     data = request.get_json()
     if db.session.query(User).filter_by(email=data['email']).first():
         return jsonify({'error': 'Email already exists'}), 400
 
+    try:
+        password_hash = password_hasher.hash(data['password'])
+    except HashingBusy:
+        return jsonify({'error': 'Server is busy, retry later'}), 503, {'Retry-After': '1'}
+
     user = User(
         email=data['email'],
-        password_hash=generate_password_hash(data['password']),
+        password_hash=password_hash,
         role=data['role']
     )
 
@@ -40,10 +61,15 @@ def register():
 
 
 @bp.route('/auth/login', methods=['POST'])
+@query_budget(2)
 def login():
     data = request.get_json()
     user = db.session.query(User).filter_by(email=data['email']).first()
-    if not user or not check_password_hash(user.password_hash, data['password']):
+    try:
+        valid = user is not None and password_hasher.check(user.password_hash, data['password'])
+    except HashingBusy:
+        return jsonify({'error': 'Server is busy, retry later'}), 503, {'Retry-After': '1'}
+    if not valid:
         return jsonify({'error': 'Invalid credentials'}), 401
     if not user.is_active:
         return jsonify({'error': 'Account is inactive'}), 403
@@ -51,14 +77,25 @@ def login():
     # Преобразуем user.id в строку для JWT
     access_token = create_access_token(identity=str(user.id))
     refresh_token = create_refresh_token(identity=str(user.id))
+    role = user.role.value
+
+    # Пароль известен только сейчас, поэтому устаревшие параметры хеша обновляем при входе
+    if password_hasher.needs_rehash(user.password_hash):
+        try:
+            user.password_hash = password_hasher.hash(data['password'])
+            db.session.commit()
+        except HashingBusy:
+            pass
+
     return jsonify({
         'access_token': access_token,
         'refresh_token': refresh_token,
-        'role': user.role.value
+        'role': role
     }), 200
 
 
 @bp.route('/auth/refresh', methods=['POST'])
+@query_budget(0)
 @jwt_required(refresh=True)
 def refresh():
     current_user_id = get_jwt_identity()
@@ -67,6 +104,7 @@ def refresh():
 
 
 @bp.route('/patient/profile', methods=['GET'])
+@query_budget(2)
 @jwt_required()
 def get_patient_profile():
     current_user_id = get_jwt_identity()
@@ -89,7 +127,28 @@ def get_patient_profile():
     }), 200
 
 
+def parse_measurement_values(data):
+    # Числа могут прийти строками ("120"): приводим к типу столбца, иначе тренд упадёт на арифметике
+    values = {}
+    for field, kind in MEASUREMENT_TYPES.items():
+        value = data.get(field)
+        if value is None:
+            values[field] = None
+            continue
+        try:
+            if isinstance(value, bool):
+                raise ValueError
+            number = float(value)
+        except (TypeError, ValueError):
+            raise ValueError(f'{field} must be a number')
+        if not math.isfinite(number) or (kind is int and not number.is_integer()):
+            raise ValueError(f'{field} must be a finite {"integer" if kind is int else "number"}')
+        values[field] = kind(number)
+    return values
+
+
 @bp.route('/patient/measurements', methods=['GET', 'POST'])
+@query_budget(6)
 @jwt_required()
 def handle_measurements():
     current_user_id = get_jwt_identity()
@@ -99,22 +158,41 @@ def handle_measurements():
 
     if request.method == 'POST':
         data = request.get_json()
-        from datetime import datetime
+        try:
+            values = parse_measurement_values(data)
+            measured_at = datetime.fromisoformat(data.get('measured_at', datetime.utcnow().isoformat()))
+        except (TypeError, ValueError) as e:
+            return jsonify({'error': str(e)}), 400
         m = Measurement(
             patient_id=user.patient.id,
-            glucose=data.get('glucose'),
-            systolic_bp=data.get('systolic_bp'),
-            diastolic_bp=data.get('diastolic_bp'),
-            pulse=data.get('pulse'),
-            weight=data.get('weight'),
-            measured_at=datetime.fromisoformat(data.get('measured_at', datetime.utcnow().isoformat()))
+            measured_at=measured_at,
+            **values
         )
         db.session.add(m)
+        anomalies = trends.record_measurement(user.patient.id, m, current_app.config)
+        db.session.flush()
+        measurement_id, user_id = m.id, user.id
         db.session.commit()
-        return jsonify({'message': 'Measurement added', 'id': m.id}), 201
-
-    measurements = db.session.query(Measurement).filter_by(patient_id=user.patient.id).order_by(
-        Measurement.measured_at.desc()).limit(100).all()
+        # Уведомление пишется только после того, как измерение сохранено (см. trends.notify_anomalies)
+        trends.notify_anomalies(user_id, anomalies)
+        return jsonify({'message': 'Measurement added', 'id': measurement_id, 'anomalies': anomalies}), 201
+
+    # Старые измерения читаются из архивных блоков прозрачно для клиента
+    if request.args.get('date_from') or request.args.get('date_to'):
+        # Границы — календарные дни, как в аналитике: date_to включает весь указанный день
+        try:
+            date_from = date.fromisoformat(request.args['date_from']) if request.args.get('date_from') else None
+            date_to = date.fromisoformat(request.args['date_to']) if request.args.get('date_to') else None
+        except ValueError:
+            return jsonify({'error': 'date_from and date_to must be ISO dates (YYYY-MM-DD)'}), 400
+        if date_from and date_to and date_from > date_to:
+            return jsonify({'error': 'date_from must not be after date_to'}), 400
+        start = datetime.combine(date_from, time.min) if date_from else datetime.min
+        end = datetime.combine(date_to + timedelta(days=1), time.min) if date_to and date_to < date.max \
+            else datetime.max
+        measurements = measurement_archive.measurements_in_range(user.patient.id, start, end)
+    else:
+        measurements = measurement_archive.latest_measurements(user.patient.id, 100)
     return jsonify([{
         'id': m.id,
         'glucose': m.glucose,
@@ -127,6 +205,7 @@ def handle_measurements():
 
 
 @bp.route('/patient/prescriptions', methods=['GET'])
+@query_budget(3)
 @jwt_required()
 def get_prescriptions():
     current_user_id = get_jwt_identity()
@@ -150,6 +229,7 @@ def get_prescriptions():
 
 
 @bp.route('/patient/complaints', methods=['GET', 'POST'])
+@query_budget(4)
 @jwt_required()
 def handle_complaints():
     current_user_id = get_jwt_identity()
@@ -183,26 +263,118 @@ def handle_complaints():
 
 
 @bp.route('/doctor/patients', methods=['GET'])
+@query_budget(4, fan_outs=3)
 @jwt_required()
 def get_patients():
     current_user_id = get_jwt_identity()
     user = db.session.query(User).get(int(current_user_id))
-    if user.role != 'doctor' or not user.doctor:
+    if user.role != 'doctor' or not user.doctor_id:
         return jsonify({'error': 'Access denied'}), 403
 
-    patients = db.session.query(Patient).join(Consultation).filter(
-        Consultation.doctor_id == user.doctor.id).distinct().all()
-    return jsonify([{
-        'id': p.id,
-        'surname': p.surname,
-        'name': p.name,
-        'patronim': p.patronim,
-        'birth_date': p.birth_date.isoformat(),
-        'gender': p.gender.value
-    } for p in patients]), 200
+    sort = request.args.get('sort', 'last_visit')
+    if sort not in ('last_visit', 'surname'):
+        return jsonify({'error': 'sort must be last_visit or surname'}), 400
+    try:
+        limit = parse_limit(request.args.get('limit'))
+        cursor = decode_cursor(request.args['cursor'], CURSOR_TYPES[sort]) if request.args.get('cursor') else None
+        last_visit = datetime.fromisoformat(cursor[0]) if cursor and sort == 'last_visit' else None
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # Keyset-пагинация по связям врач–пациент вместо DISTINCT по всем консультациям врача
+    stmt = select(Patient.id, Patient.surname, Patient.name, Patient.patronim, Patient.birth_date, Patient.gender,
+                  DoctorPatient.last_consultation_at).join(
+        DoctorPatient, DoctorPatient.patient_id == Patient.id).where(DoctorPatient.doctor_id == user.doctor_id)
+    if sort == 'surname':
+        if cursor:
+            stmt = stmt.where(tuple_(Patient.surname, Patient.name, Patient.id) > tuple(cursor))
+        stmt = stmt.order_by(Patient.surname, Patient.name, Patient.id)
+    else:
+        if cursor:
+            stmt = stmt.where(tuple_(DoctorPatient.last_consultation_at, Patient.id) < (last_visit, cursor[1]))
+        stmt = stmt.order_by(DoctorPatient.last_consultation_at.desc(), Patient.id.desc())
+    # При шардировании каждый шард отдаёт свою первую страницу, общая собирается слиянием в том же порядке
+    rows = sharding.fan_out_rows(stmt.limit(limit + 1))
+    if sort == 'surname':
+        rows.sort(key=lambda r: (r.surname, r.name, r.id))
+    else:
+        rows.sort(key=lambda r: (r.last_consultation_at, r.id), reverse=True)
+    rows = rows[:limit + 1]
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor([last.surname, last.name, last.id] if sort == 'surname'
+                                    else [last.last_consultation_at.isoformat(), last.id])
+
+    # Последнее измерение каждого пациента страницы одним запросом на шард: по одному поиску в индексе на пациента
+    latest_id = select(Measurement.id).where(Measurement.patient_id == Patient.id).order_by(
+        Measurement.measured_at.desc()).limit(1).correlate(Patient).scalar_subquery()
+    readings = {m.patient_id: m for m in sharding.fan_out_by_patient(
+        [r.id for r in rows],
+        lambda ids: select(Measurement.patient_id, Measurement.glucose, Measurement.systolic_bp,
+                           Measurement.diastolic_bp, Measurement.pulse, Measurement.weight,
+                           Measurement.measured_at).where(
+            Measurement.id.in_(select(latest_id).where(Patient.id.in_(ids))))
+    )} if rows else {}
+    # Если все измерения пациента уже упакованы в блоки, последнее берём из самого свежего блока
+    missing = [r.id for r in rows if r.id not in readings]
+    if missing:
+        readings.update(measurement_archive.latest_archived_measurements(missing))
+
+    return jsonify({
+        'patients': [{
+            'id': r.id,
+            'surname': r.surname,
+            'name': r.name,
+            'patronim': r.patronim,
+            'birth_date': r.birth_date.isoformat(),
+            'gender': r.gender.value,
+            'last_consultation_at': r.last_consultation_at.isoformat(),
+            'latest_measurement': {
+                'glucose': readings[r.id].glucose,
+                'systolic_bp': readings[r.id].systolic_bp,
+                'diastolic_bp': readings[r.id].diastolic_bp,
+                'pulse': readings[r.id].pulse,
+                'weight': readings[r.id].weight,
+                'measured_at': readings[r.id].measured_at.isoformat()
+            } if r.id in readings else None
+        } for r in rows],
+        'next_cursor': next_cursor
+    }), 200
+
+
+@bp.route('/doctor/analytics/measurements', methods=['GET'])
+@query_budget(4, fan_outs=3)
+@jwt_required()
+def get_cohort_analytics():
+    current_user_id = get_jwt_identity()
+    user = db.session.query(User).get(int(current_user_id))
+    if user.role != 'doctor' or not user.doctor_id:
+        return jsonify({'error': 'Access denied'}), 403
+
+    try:
+        cohort = analytics.parse_filter(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    result = analytics.cohort_statistics(user.doctor_id, cohort)
+    return jsonify({
+        'filter': {
+            'diagnosis_category': cohort.diagnosis_category,
+            'age_min': cohort.age_min,
+            'age_max': cohort.age_max,
+            'gender': cohort.gender,
+            'date_from': cohort.date_from.isoformat(),
+            'date_to': cohort.date_to.isoformat()
+        },
+        **result
+    }), 200
 
 
 @bp.route('/doctor/patient/<int:patient_id>/card', methods=['GET'])
+@query_budget(8)
 @jwt_required()
 def get_patient_card(patient_id):
     current_user_id = get_jwt_identity()
@@ -231,8 +403,8 @@ def get_patient_card(patient_id):
             'pulse': m.pulse,
             'weight': m.weight,
             'measured_at': m.measured_at.isoformat()
-        } for m in db.session.query(Measurement).filter_by(patient_id=patient_id).order_by(
-            Measurement.measured_at.desc()).limit(20).all()],
+        } for m in measurement_archive.latest_measurements(patient_id, 20)],
+        'trend': trends.serialize_trend(db.session.query(PatientTrend).filter_by(patient_id=patient_id).first()),
         'prescriptions': [{
             'id': p.id,
             'medication_name': p.medication_name,
@@ -257,6 +429,7 @@ def get_patient_card(patient_id):
 
 
 @bp.route('/doctor/prescriptions', methods=['POST'])
+@query_budget(4)
 @jwt_required()
 def create_prescription():
     current_user_id = get_jwt_identity()
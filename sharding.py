@@ -0,0 +1,222 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, func, inspect, select
+from sqlalchemy.sql import operators
+from sqlalchemy.sql.elements import BinaryExpression, BindParameter, BooleanClauseList
+
+# Таблицы, принадлежащие пациенту: при SHARD_COUNT > 0 они лежат в shard-файлах, остальные — в общей базе
+SHARDED_TABLES = frozenset({
+    'measurements', 'measurement_blocks', 'complaints', 'prescriptions', 'prescription_history', 'consultations',
+    'patient_diagnoses', 'doctor_patients', 'patient_trends',
+})
+SHARED_SCHEMA = 'shared'
+# Таблицы шардов, чьи id отдаются в API. В шарде s их id дают остаток s по модулю SHARD_COUNT,
+# поэтому id не повторяются между шардами (локальные последовательности SQLite у каждого файла свои)
+GLOBAL_ID_TABLES = frozenset({'measurements', 'complaints', 'prescriptions'})
+
+# Поля threading.local с состоянием текущего запроса (метрики, бюджет запросов, счётчики бенчмарков)
+_request_state = set()
+
+_executor = None
+
+
+class ShardRoutingError(Exception):
+    pass
+
+
+def shard_count():
+    return current_app.config.get('SHARD_COUNT', 0)
+
+
+def shard_for(patient_id, count=None):
+    return int(patient_id) % (count or shard_count())
+
+
+def shard_key(shard_id):
+    return f'shard_{shard_id}'
+
+
+def is_sharded(table):
+    return bool(shard_count()) and table.name in SHARDED_TABLES
+
+
+def shard_engines():
+    engines = current_app.extensions['sqlalchemy'].engines
+    return [engines[shard_key(i)] for i in range(shard_count())]
+
+
+def configure_binds(app):
+    count = app.config.get('SHARD_COUNT', 0)
+    if not count:
+        return
+    uri = app.config['SHARD_DATABASE_URI']
+    binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+    binds.update({shard_key(i): uri.format(i) for i in range(count)})
+    app.config['SQLALCHEMY_BINDS'] = binds
+
+
+def init_shards(app, db, metadata):
+    global _executor
+    count = app.config.get('SHARD_COUNT', 0)
+    if not count:
+        return []
+
+    shared_path = db.engine.url.database
+    engines = [db.engines[shard_key(i)] for i in range(count)]
+    for engine in engines:
+        # Общая база подключается к каждому shard-файлу, чтобы запросы могли соединяться с patients
+        @event.listens_for(engine, 'connect')
+        def attach_shared(dbapi_connection, connection_record):
+            dbapi_connection.execute(f'ATTACH DATABASE ? AS {SHARED_SCHEMA}', (shared_path,))
+
+        metadata.create_all(bind=engine, tables=[t for t in metadata.sorted_tables if t.name in SHARDED_TABLES])
+
+    if _executor is not None:
+        _executor.shutdown(wait=False)
+    _executor = ThreadPoolExecutor(max_workers=count, thread_name_prefix='shard-fan-out')
+    return engines
+
+
+def shard_row_id(table, shard_id, count=None):
+    # Следующий id строки шарда: первое число больше текущего максимума с остатком shard_id.
+    # Выражение вычисляется внутри самого INSERT под блокировкой записи, так что лишнего запроса и гонки нет
+    count = count or shard_count()
+    return (func.coalesce(select(func.max(table.c.id)).scalar_subquery(), 0) // count + 1) * count + shard_id
+
+
+def share_request_state(local, name):
+    # Запросы fan_out выполняются в потоках пула; зарегистрированное поле передаётся им от вызывающего потока
+    _request_state.add((local, name))
+
+
+def unshare_request_state(local, name):
+    _request_state.discard((local, name))
+
+
+def _with_request_state(run):
+    captured = [(local, name, getattr(local, name, None)) for local, name in list(_request_state)]
+
+    def wrapper(item):
+        for local, name, value in captured:
+            setattr(local, name, value)
+        try:
+            return run(item)
+        finally:
+            for local, name, _ in captured:
+                setattr(local, name, None)
+
+    return wrapper
+
+
+def _all_rows(result):
+    return result.all()
+
+
+def fan_out(stmt, consume=_all_rows):
+    # Выполняет запрос на всех шардах параллельно; возвращает consume(result) каждого шарда
+    if not shard_count():
+        return [consume(current_app.extensions['sqlalchemy'].session.execute(stmt))]
+
+    def run(engine):
+        with engine.connect() as connection:
+            return consume(connection.execute(stmt))
+
+    return list(_executor.map(_with_request_state(run), shard_engines()))
+
+
+def fan_out_rows(stmt):
+    return [row for rows in fan_out(stmt) for row in rows]
+
+
+def fan_out_by_patient(patient_ids, build_stmt):
+    # Запрос строится отдельно для пациентов каждого шарда и выполняется только там, где они есть
+    if not shard_count():
+        return current_app.extensions['sqlalchemy'].session.execute(build_stmt(list(patient_ids))).all()
+
+    by_shard = {}
+    for patient_id in patient_ids:
+        by_shard.setdefault(shard_for(patient_id), []).append(patient_id)
+    engines = shard_engines()
+
+    def run(item):
+        shard_id, ids = item
+        with engines[shard_id].connect() as connection:
+            return connection.execute(build_stmt(ids)).all()
+
+    return [row for rows in _executor.map(_with_request_state(run), by_shard.items()) for row in rows]
+
+
+def _sharded_table(mapper, clause):
+    if mapper is not None:
+        table = inspect(mapper).local_table
+    else:
+        table = getattr(clause, 'table', None)
+    if table is not None and getattr(table, 'name', None) in SHARDED_TABLES:
+        return table
+    return None
+
+
+def _and_terms(expression):
+    if isinstance(expression, BooleanClauseList) and expression.operator is operators.and_:
+        for clause in expression.clauses:
+            yield from _and_terms(clause)
+    else:
+        yield expression
+
+
+def _patient_id_from_clause(clause, table):
+    where = getattr(clause, 'whereclause', None)
+    if where is None:
+        return None
+    for term in _and_terms(where):
+        if not isinstance(term, BinaryExpression) or term.operator is not operators.eq:
+            continue
+        column, value = term.left, term.right
+        if isinstance(column, BindParameter):
+            column, value = value, column
+        if (isinstance(value, BindParameter) and getattr(column, 'key', None) == 'patient_id'
+                and getattr(getattr(column, 'table', None), 'name', None) == table.name):
+            return value.effective_value
+    return None
+
+
+class ShardedSession(Session):
+    def __init__(self, db, **kwargs):
+        sharded = bool(shard_count())
+        if sharded:
+            # Перечитать объект после commit можно только по первичному ключу, а по нему шард не определить.
+            # sessionmaker всегда передаёт expire_on_commit явно, поэтому значение заменяется, а не дополняется
+            kwargs['expire_on_commit'] = False
+        super().__init__(db, **kwargs)
+        if sharded:
+            self.connection_callable = self._shard_connection
+            event.listen(self, 'before_flush', self._assign_row_ids)
+
+    def _assign_row_ids(self, session, flush_context, instances):
+        for instance in session.new:
+            table = inspect(instance).mapper.local_table
+            if table.name in GLOBAL_ID_TABLES and instance.id is None:
+                instance.id = shard_row_id(table, shard_for(instance.patient_id))
+
+    def _shard_connection(self, mapper=None, instance=None, **kwargs):
+        # Используется при flush: соединение выбирается по patient_id сохраняемого объекта
+        return self.connection(bind_arguments={'mapper': mapper, 'instance': instance})
+
+    def get_bind(self, mapper=None, clause=None, bind=None, shard_id=None, instance=None, patient_id=None,
+                 **kwargs):
+        # patient_id можно передать в bind_arguments для запросов, где его нет в WHERE (например, upsert)
+        count = shard_count() if bind is None else 0
+        table = _sharded_table(mapper, clause) if count else None
+        if table is not None:
+            if shard_id is None:
+                if patient_id is None:
+                    patient_id = getattr(instance, 'patient_id', None) if instance is not None \
+                        else _patient_id_from_clause(clause, table)
+                if patient_id is None:
+                    raise ShardRoutingError(f'Statement on {table.name} has no patient_id to choose a shard; '
+                                            f'filter by patient_id or use sharding.fan_out')
+                shard_id = shard_for(patient_id, count)
+            return self._db.engines[shard_key(shard_id)]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
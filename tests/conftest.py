@@ -0,0 +1,82 @@
+from collections import namedtuple
+
+import pytest
+from flask_jwt_extended import create_access_token, create_refresh_token
+from sqlalchemy import select
+
+import analytics
+import trends
+from app import create_app, db
+from benchmarks.harness import QueryCounter
+from config import Config
+from data.generate_data import build_parser, generate
+from models import User, DoctorPatient, PatientTrend, Symptom, RoleEnum
+from sharding import fan_out_rows
+
+PASSWORD = 'default123'
+
+Seed = namedtuple('Seed', ['patient_id', 'patient_email', 'patient_token', 'refresh_token', 'doctor_token',
+                           'symptom_id', 'usual_reading'])
+
+
+# Число шардов задаётся через parametrize(..., indirect=True); по умолчанию одна база
+@pytest.fixture
+def app(request, tmp_path):
+    config = type('TestConfig', (Config,), {
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'medical.db'}",
+        'SHARD_COUNT': getattr(request, 'param', 0),
+        'SHARD_DATABASE_URI': f"sqlite:///{tmp_path / 'medical_shard_{}.db'}",
+        'QUERY_BUDGET_MODE': 'raise',
+        'TREND_WARMUP': 3
+    })
+    app = create_app(config)
+    with app.app_context():
+        # Небольшой детерминированный набор: врачи, пациенты, консультации, измерения и тренды
+        generate(build_parser().parse_args(['--patients', '6', '--doctors', '2', '--measurements-per-patient', '20',
+                                            '--history-days', '60', '--password', PASSWORD]))
+        trends.rebuild_trends(app.config)
+        analytics._cohort_statistics.cache_clear()
+        yield app
+        db.session.remove()
+        for engine in db.engines.values():
+            engine.dispose()
+
+
+def usual_reading(trend):
+    return {metric: round(getattr(trend, f'{metric}_mean'), 1) if metric in ('glucose', 'weight')
+            else round(getattr(trend, f'{metric}_mean')) for metric in trends.METRICS}
+
+
+@pytest.fixture
+def seed(app):
+    # Связи врач–пациент могут лежать в разных шардах, поэтому берём первую по пациенту со всех шардов
+    patient_id, doctor_id = min(fan_out_rows(select(DoctorPatient.patient_id, DoctorPatient.doctor_id)))
+    patient_user = db.session.query(User).filter_by(patient_id=patient_id).one()
+    doctor_user = db.session.query(User).filter_by(role=RoleEnum.doctor, doctor_id=doctor_id).one()
+    seed = Seed(
+        patient_id=patient_id,
+        patient_email=patient_user.email,
+        patient_token=create_access_token(identity=str(patient_user.id)),
+        refresh_token=create_refresh_token(identity=str(patient_user.id)),
+        doctor_token=create_access_token(identity=str(doctor_user.id)),
+        symptom_id=db.session.query(Symptom.id).order_by(Symptom.id).first()[0],
+        # Показания на уровне собственной нормы пациента: такое измерение не считается аномалией
+        usual_reading=usual_reading(db.session.query(PatientTrend).filter_by(patient_id=patient_id).one())
+    )
+    db.session.remove()
+    return seed
+
+
+# Выполняет запрос тестовым клиентом и возвращает (ответ, число SQL-запросов)
+@pytest.fixture
+def call(app):
+    client = app.test_client()
+
+    def request(method, path, token=None, body=None):
+        headers = {'Authorization': f'Bearer {token}'} if token else {}
+        with QueryCounter(db.engines.values()) as counter:
+            counter.reset()
+            response = client.open(path, method=method, json=body, headers=headers)
+        return response, counter.count
+
+    return request
@@ -0,0 +1,34 @@
+from datetime import date, datetime
+
+import analytics
+import measurement_archive
+from app import db
+from models import Measurement, DoctorPatient, Patient, GenderEnum
+
+
+def add_measurement(patient_id):
+    db.session.add(Measurement(patient_id=patient_id, glucose=5.5, systolic_bp=120, diastolic_bp=80, pulse=70,
+                               weight=75.0, measured_at=datetime(2025, 12, 15)))
+    db.session.commit()
+
+
+def test_version_ignores_other_doctors_patients(app):
+    link = db.session.query(DoctorPatient).order_by(DoctorPatient.id).first()
+    # Пациент без консультаций не входит ни в одну когорту
+    stranger = Patient(surname='Новиков', name='Иван', gender=GenderEnum.male, birth_date=date(1980, 1, 1))
+    db.session.add(stranger)
+    db.session.commit()
+
+    version = analytics.data_version(link.doctor_id)
+    add_measurement(stranger.id)
+    assert analytics.data_version(link.doctor_id) == version
+
+    add_measurement(link.patient_id)
+    assert analytics.data_version(link.doctor_id) != version
+
+
+def test_version_changes_after_compaction(app):
+    link = db.session.query(DoctorPatient).order_by(DoctorPatient.id).first()
+    version = analytics.data_version(link.doctor_id)
+    measurement_archive.compact_measurements(0, now=datetime(2030, 1, 1))
+    assert analytics.data_version(link.doctor_id) != version
@@ -0,0 +1,27 @@
+import pytest
+
+PATH = '/doctor/analytics/measurements'
+
+
+@pytest.mark.parametrize('query', [
+    'age_max=3000',
+    'age_min=-1',
+    'age_min=60&age_max=20',
+    'percentiles=nan',
+    'percentiles=50,101',
+    'date_from=2025-12-31&date_to=2025-12-01',
+    'bins=0',
+])
+def test_invalid_filter_is_rejected(seed, call, query):
+    response, _ = call('GET', f'{PATH}?{query}', seed.doctor_token)
+    assert response.status_code == 400, response.get_json()
+
+
+@pytest.mark.parametrize('query', [
+    'date_from=2025-11-01&date_to=9999-12-31',
+    'date_to=0001-01-05',
+    'age_min=0&age_max=150',
+])
+def test_extreme_valid_filter_is_accepted(seed, call, query):
+    response, _ = call('GET', f'{PATH}?{query}', seed.doctor_token)
+    assert response.status_code == 200, response.get_json()
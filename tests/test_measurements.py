@@ -0,0 +1,94 @@
+import threading
+
+import pytest
+from flask_jwt_extended import create_access_token
+from sqlalchemy import text
+
+from app import db
+from models import Measurement, PatientTrend, User
+
+READING = {'glucose': 5.5, 'systolic_bp': 120, 'diastolic_bp': 80, 'pulse': 70, 'weight': 75.0}
+ANOMALOUS_READING = {'glucose': 19.5, 'systolic_bp': 210, 'diastolic_bp': 125, 'pulse': 140, 'weight': 160.0}
+
+
+@pytest.fixture
+def new_patient_token(app, call):
+    call('POST', '/auth/register', body={
+        'email': 'first-reading@synthetic.local', 'password': 'secret', 'role': 'patient', 'surname': 'Новиков',
+        'name': 'Иван', 'gender': 'м', 'birth_date': '1980-01-01'})
+    user = db.session.query(User).filter_by(email='first-reading@synthetic.local').one()
+    token, patient_id = create_access_token(identity=str(user.id)), user.patient_id
+    db.session.remove()
+    return token, patient_id
+
+
+def test_numeric_strings_are_coerced(new_patient_token, call):
+    token, patient_id = new_patient_token
+    body = {field: str(value) for field, value in READING.items()}
+    for _ in range(2):
+        response, _ = call('POST', '/patient/measurements', token, body)
+        assert response.status_code == 201
+    stored = db.session.query(Measurement).filter_by(patient_id=patient_id).first()
+    assert (stored.systolic_bp, stored.glucose) == (120, 5.5)
+
+
+def test_usual_reading_is_not_anomaly(seed, call):
+    response, _ = call('POST', '/patient/measurements', seed.patient_token, seed.usual_reading)
+    assert response.status_code == 201
+    assert response.get_json()['anomalies'] == []
+
+
+def test_anomaly_reaches_notification(seed, call):
+    user_id = db.session.query(User.id).filter_by(email=seed.patient_email).scalar()
+    response, _ = call('POST', '/patient/measurements', seed.patient_token, ANOMALOUS_READING)
+    assert response.status_code == 201
+    assert response.get_json()['anomalies']
+    notifications = db.session.execute(text('SELECT type, message FROM notifications WHERE user_id = :user_id'),
+                                       {'user_id': user_id}).all()
+    assert [type_ for type_, _ in notifications] == ['warning']
+    assert 'systolic_bp: 210' in notifications[0].message
+
+
+@pytest.mark.parametrize('field, value', [
+    ('glucose', 'много'),
+    ('glucose', 'nan'),
+    ('systolic_bp', 120.5),
+    ('pulse', True),
+    ('weight', [75]),
+])
+def test_invalid_values_are_rejected(seed, call, field, value):
+    response, _ = call('POST', '/patient/measurements', seed.patient_token, {**READING, field: value})
+    assert response.status_code == 400
+
+
+def test_concurrent_first_readings_share_one_trend(app, new_patient_token):
+    token, patient_id = new_patient_token
+    statuses, barrier = [], threading.Barrier(4)
+    # Одинаковое время: ни одно измерение не считается добавленным задним числом и входит в тренд
+    body = {**READING, 'measured_at': '2026-01-02T09:00:00'}
+
+    def post():
+        client = app.test_client()
+        barrier.wait()
+        statuses.append(client.post('/patient/measurements', json=body,
+                                    headers={'Authorization': f'Bearer {token}'}).status_code)
+
+    threads = [threading.Thread(target=post) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert statuses == [201] * 4
+    trend = db.session.query(PatientTrend).filter_by(patient_id=patient_id).one()
+    assert trend.glucose_count == 4
+
+
+def test_failed_notification_keeps_measurement(seed, call):
+    # Уведомление пишется после commit измерения: его сбой не должен откатывать само измерение
+    db.session.execute(text('DROP TABLE notifications'))
+    db.session.commit()
+    response, _ = call('POST', '/patient/measurements', seed.patient_token, ANOMALOUS_READING)
+    assert response.status_code == 201
+    assert response.get_json()['anomalies']
+    assert db.session.get(Measurement, response.get_json()['id']).systolic_bp == 210
@@ -0,0 +1,52 @@
+import pytest
+
+from app import create_app, db
+from config import Config
+
+TOKEN = 'scrape-token'
+
+
+@pytest.fixture
+def make_app(tmp_path):
+    apps = []
+
+    def factory(**overrides):
+        config = type('MetricsConfig', (Config,), {
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'medical.db'}",
+            'SHARD_COUNT': 0,
+            'QUERY_BUDGET_MODE': 'off',
+            **overrides
+        })
+        app = create_app(config)
+        apps.append(app)
+        return app
+
+    yield factory
+    for app in apps:
+        with app.app_context():
+            for engine in db.engines.values():
+                engine.dispose()
+
+
+def test_metrics_are_off_by_default(make_app):
+    assert make_app().test_client().get('/metrics').status_code == 404
+
+
+def test_enabled_metrics_require_token(make_app):
+    with pytest.raises(ValueError):
+        make_app(METRICS_ENABLED=True)
+
+
+@pytest.mark.parametrize('headers', [{}, {'Authorization': 'Bearer wrong'}, {'Authorization': TOKEN}])
+def test_metrics_reject_anonymous_scrape(make_app, headers):
+    response = make_app(METRICS_ENABLED=True, METRICS_TOKEN=TOKEN).test_client().get('/metrics', headers=headers)
+    assert response.status_code == 401
+    assert b'medsystem_' not in response.data
+
+
+def test_metrics_served_with_token(make_app):
+    client = make_app(METRICS_ENABLED=True, METRICS_TOKEN=TOKEN).test_client()
+    client.get('/auth/refresh')
+    response = client.get('/metrics', headers={'Authorization': f'Bearer {TOKEN}'})
+    assert response.status_code == 200
+    assert b'medsystem_http_requests_total' in response.data
@@ -0,0 +1,40 @@
+import pytest
+
+from pagination import encode_cursor
+
+
+@pytest.mark.parametrize('sort', ['last_visit', 'surname'])
+def test_pages_cover_full_list(seed, call, sort):
+    full, _ = call('GET', f'/doctor/patients?sort={sort}&limit=200', seed.doctor_token)
+    expected = [p['id'] for p in full.get_json()['patients']]
+
+    seen, cursor = [], None
+    while True:
+        path = f'/doctor/patients?sort={sort}&limit=2' + (f'&cursor={cursor}' if cursor else '')
+        response, _ = call('GET', path, seed.doctor_token)
+        assert response.status_code == 200
+        page = response.get_json()
+        seen.extend(p['id'] for p in page['patients'])
+        cursor = page['next_cursor']
+        if cursor is None:
+            break
+    assert seen == expected
+
+
+@pytest.mark.parametrize('sort, values', [
+    ('surname', ['Иванов']),
+    ('surname', ['Иванов', 'Иван', 1, 2]),
+    ('surname', ['Иванов', 'Иван', '1']),
+    ('last_visit', ['2025-12-01T10:00:00']),
+    ('last_visit', ['не дата', 1]),
+    ('last_visit', [1, 1]),
+    ('last_visit', {'id': 1}),
+])
+def test_malformed_cursor_is_rejected(seed, call, sort, values):
+    response, _ = call('GET', f'/doctor/patients?sort={sort}&cursor={encode_cursor(values)}', seed.doctor_token)
+    assert response.status_code == 400
+
+
+def test_garbage_cursor_is_rejected(seed, call):
+    response, _ = call('GET', '/doctor/patients?cursor=%%%', seed.doctor_token)
+    assert response.status_code == 400
@@ -0,0 +1,61 @@
+import pytest
+from flask import Flask
+from werkzeug.security import generate_password_hash
+
+from app import db, password_hasher
+from models import User
+from password_hashing import PasswordHasher
+
+PASSWORD = 'default123'
+
+
+def make_hasher(method, deprecated=()):
+    app = Flask(__name__)
+    app.config.update(PASSWORD_HASH_METHOD=method, PASSWORD_HASH_DEPRECATED=deprecated, PASSWORD_HASH_WORKERS=1)
+    return PasswordHasher(app)
+
+
+def stored(method):
+    return generate_password_hash('secret', method=method)
+
+
+@pytest.mark.parametrize('method, deprecated, current, expected', [
+    # Более сильный или другой, не устаревший хеш не заменяется
+    ('pbkdf2:sha256:600000', (), 'scrypt:32768:8:1', False),
+    ('scrypt', (), 'pbkdf2:sha256:600000', False),
+    ('pbkdf2:sha256:600000', (), 'pbkdf2:sha256:1000000', False),
+    ('scrypt:16384:8:1', (), 'scrypt:32768:8:1', False),
+    ('pbkdf2:sha256:600000', (), 'pbkdf2:sha512:1000', False),
+    # Сокращённое имя метода сравнивается с развёрнутыми параметрами
+    ('scrypt', (), 'scrypt:32768:8:1', False),
+    ('pbkdf2', (), 'pbkdf2:sha256:1000000', False),
+    # Обновление вверх
+    ('pbkdf2', (), 'pbkdf2:sha256:600000', True),
+    ('scrypt', (), 'scrypt:16384:8:1', True),
+    ('scrypt', ('pbkdf2',), 'pbkdf2:sha256:600000', True),
+])
+def test_needs_rehash(method, deprecated, current, expected):
+    assert make_hasher(method, deprecated).needs_rehash(stored(current)) is expected
+
+
+def test_fresh_hash_is_not_rehashed():
+    hasher = make_hasher('pbkdf2')
+    assert not hasher.needs_rehash(hasher.hash('secret'))
+
+
+def test_login_upgrades_weak_hash_once(seed, call, monkeypatch):
+    monkeypatch.setattr(password_hasher, 'deprecated', ('pbkdf2',))
+    user = db.session.query(User).filter_by(email=seed.patient_email).one()
+    user.password_hash = generate_password_hash(PASSWORD, method='pbkdf2:sha256:1000')
+    db.session.commit()
+
+    body = {'email': seed.patient_email, 'password': PASSWORD}
+    response, queries = call('POST', '/auth/login', body=body)
+    assert response.status_code == 200
+    assert queries == 2
+    db.session.expire_all()
+    assert db.session.query(User).filter_by(email=seed.patient_email).one().password_hash.startswith('scrypt:')
+
+    response, queries = call('POST', '/auth/login', body=body)
+    assert response.status_code == 200
+    assert queries == 1
@@ -0,0 +1,108 @@
+from datetime import datetime
+
+import pytest
+
+import measurement_archive
+from query_budget import QueryBudgetExceeded
+from routes import bp
+from test_measurements import ANOMALOUS_READING
+ANALYTICS_RANGE = 'date_from=2025-11-01&date_to=2025-12-31'
+
+# (название, метод, путь, роль токена, тело запроса, число SQL-запросов)
+CASES = [
+    ('register_patient', 'POST', '/auth/register', None, lambda s: {
+        'email': 'new-patient@synthetic.local', 'password': 'secret', 'role': 'patient', 'surname': 'Новиков',
+        'name': 'Иван', 'gender': 'м', 'birth_date': '1980-01-01'}, 3),
+    ('login', 'POST', '/auth/login', None, lambda s: {'email': s.patient_email, 'password': 'default123'}, 1),
+    ('refresh', 'POST', '/auth/refresh', 'refresh', None, 0),
+    ('patient_profile', 'GET', '/patient/profile', 'patient', None, 2),
+    ('measurements_latest', 'GET', '/patient/measurements', 'patient', None, 4),
+    ('measurements_range', 'GET', '/patient/measurements?date_from=2025-12-01&date_to=2025-12-31', 'patient',
+     None, 4),
+    ('measurements_add', 'POST', '/patient/measurements', 'patient', lambda s: s.usual_reading, 5),
+    ('measurements_add_anomaly', 'POST', '/patient/measurements', 'patient', lambda s: ANOMALOUS_READING, 6),
+    ('prescriptions', 'GET', '/patient/prescriptions', 'patient', None, 3),
+    ('complaints_list', 'GET', '/patient/complaints', 'patient', None, 3),
+    ('complaints_add', 'POST', '/patient/complaints', 'patient',
+     lambda s: {'symptom_id': s.symptom_id, 'severity': 'средняя'}, 4),
+    # На странице есть пациенты без измерений в таблице, поэтому выполняется и поиск по архивным блокам
+    ('doctor_patients_last_visit', 'GET', '/doctor/patients', 'doctor', None, 4),
+    ('doctor_patients_surname', 'GET', '/doctor/patients?sort=surname', 'doctor', None, 4),
+    ('doctor_analytics', 'GET', f'/doctor/analytics/measurements?{ANALYTICS_RANGE}', 'doctor', None, 4),
+    ('doctor_analytics_cohort', 'GET', f'/doctor/analytics/measurements?{ANALYTICS_RANGE}'
+     '&diagnosis_category=Эндокринология&age_min=20&age_max=90', 'doctor', None, 4),
+    ('doctor_patient_card', 'GET', '/doctor/patient/{patient_id}/card', 'doctor', None, 8),
+    ('doctor_prescription_add', 'POST', '/doctor/prescriptions', 'doctor', lambda s: {
+        'patient_id': s.patient_id, 'medication_name': 'Метформин', 'quantity': 500, 'dose_unit': 'мг',
+        'frequency': '2 раза в день', 'duration_days': 30, 'start_date': '2026-01-01T00:00:00'}, 4),
+]
+
+
+def token_for(seed, role):
+    return {'patient': seed.patient_token, 'doctor': seed.doctor_token, 'refresh': seed.refresh_token,
+            None: None}[role]
+
+
+@pytest.mark.parametrize('method, path, role, body, expected',
+                         [case[1:] for case in CASES], ids=[case[0] for case in CASES])
+def test_route_query_count(seed, call, method, path, role, body, expected):
+    response, queries = call(method, path.format(patient_id=seed.patient_id), token_for(seed, role),
+                             body(seed) if body else None)
+    assert response.status_code < 300, response.get_json()
+    assert queries == expected
+
+
+# При двух шардах запросы fan_out выполняются на каждом шарде и тоже входят в бюджет
+SHARDED_CASES = [
+    ('doctor_patients', '/doctor/patients', 6),
+    ('doctor_analytics', f'/doctor/analytics/measurements?{ANALYTICS_RANGE}', 7),
+]
+
+
+@pytest.mark.parametrize('app', [2], indirect=True)
+@pytest.mark.parametrize('path, expected', [case[1:] for case in SHARDED_CASES],
+                         ids=[case[0] for case in SHARDED_CASES])
+def test_sharded_route_query_count(seed, call, path, expected):
+    response, queries = call('GET', path, seed.doctor_token)
+    assert response.status_code == 200, response.get_json()
+    assert queries == expected
+
+
+def test_doctor_patients_with_archived_readings(seed, call):
+    before, _ = call('GET', '/doctor/patients', seed.doctor_token)
+    # Всё упаковано в блоки: последнее измерение страницы читается из блоков одним дополнительным запросом
+    measurement_archive.compact_measurements(0, now=datetime(2030, 1, 1))
+    after, queries = call('GET', '/doctor/patients', seed.doctor_token)
+    assert after.status_code == 200
+    assert [p['latest_measurement'] for p in after.get_json()['patients']] == \
+        [p['latest_measurement'] for p in before.get_json()['patients']]
+    assert queries == 4
+
+
+def test_analytics_cache_hit_skips_cohort_queries(seed, call):
+    path = f'/doctor/analytics/measurements?{ANALYTICS_RANGE}'
+    call('GET', path, seed.doctor_token)
+    response, queries = call('GET', path, seed.doctor_token)
+    assert response.status_code == 200
+    assert queries == 2
+
+
+def test_over_budget_raises(app, seed, call, monkeypatch):
+    monkeypatch.setattr(app.view_functions['api.get_patient_profile'], 'query_budget', 1)
+    app.config['PROPAGATE_EXCEPTIONS'] = True
+    with pytest.raises(QueryBudgetExceeded):
+        call('GET', '/patient/profile', seed.patient_token)
+
+
+def test_every_route_has_budget_and_case(app):
+    endpoints = {rule.endpoint for rule in app.url_map.iter_rules() if rule.endpoint.startswith(f'{bp.name}.')}
+    for endpoint in endpoints:
+        assert getattr(app.view_functions[endpoint], 'query_budget', None) is not None, endpoint
+    covered = {(method, rule.endpoint) for rule in app.url_map.iter_rules()
+               for method in rule.methods - {'HEAD', 'OPTIONS'}
+               for _, case_method, path, *_ in CASES
+               if case_method == method and rule.endpoint in endpoints
+               and app.url_map.bind('localhost').match(path.split('?')[0].format(patient_id=1),
+                                                      method=method)[0] == rule.endpoint}
+    assert covered == {(method, rule.endpoint) for rule in app.url_map.iter_rules() if rule.endpoint in endpoints
+                       for method in rule.methods - {'HEAD', 'OPTIONS'}}
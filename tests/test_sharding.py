@@ -0,0 +1,51 @@
+import pytest
+from sqlalchemy import inspect
+from sqlalchemy.exc import OperationalError
+
+from app import db
+from data.generate_data import count_rows
+from models import Patient, Measurement, Complaint, Prescription
+from sharding import SHARDED_TABLES, fan_out_rows, shard_engines
+
+pytestmark = pytest.mark.parametrize('app', [2], indirect=True)
+
+
+def test_shared_database_has_no_patient_tables_or_views(app):
+    inspector = inspect(db.engine)
+    assert not SHARDED_TABLES & set(inspector.get_table_names())
+    assert inspector.get_view_names() == []
+    # Чтение представления в режиме шардирования падает, а не возвращает пустой результат
+    with pytest.raises(OperationalError):
+        db.session.execute(db.text('SELECT * FROM v_critical_measurements')).all()
+
+
+def test_count_rows_counts_shared_tables_once(app):
+    assert count_rows(Patient) == 6
+    per_shard = []
+    for engine in shard_engines():
+        with engine.connect() as connection:
+            per_shard.append(connection.execute(db.select(db.func.count()).select_from(Measurement.__table__)).scalar())
+    assert all(per_shard) and count_rows(Measurement) == sum(per_shard)
+
+
+def test_created_objects_are_readable_after_commit(seed, call):
+    response, _ = call('POST', '/patient/complaints', seed.patient_token,
+                       {'symptom_id': seed.symptom_id, 'severity': 'средняя'})
+    assert response.status_code == 201 and response.get_json()['id']
+    response, _ = call('POST', '/doctor/prescriptions', seed.doctor_token, {
+        'patient_id': seed.patient_id, 'medication_name': 'Метформин', 'quantity': 500, 'dose_unit': 'мг',
+        'frequency': '2 раза в день', 'duration_days': 30, 'start_date': '2026-01-01T00:00:00'})
+    assert response.status_code == 201 and response.get_json()['id']
+
+
+def test_ids_are_unique_across_shards(seed, call):
+    response, _ = call('POST', '/patient/measurements', seed.patient_token, seed.usual_reading)
+    assert response.status_code == 201
+    new_id = response.get_json()['id']
+    for model in (Measurement, Complaint, Prescription):
+        ids = [row_id for (row_id,) in fan_out_rows(db.select(model.id))]
+        assert len(ids) == len(set(ids)), model.__tablename__
+        # В шарде s все id дают остаток s
+        assert all(row_id % 2 == patient_id % 2 for row_id, patient_id in
+                   fan_out_rows(db.select(model.id, model.patient_id))), model.__tablename__
+    assert new_id % 2 == seed.patient_id % 2
@@ -0,0 +1,167 @@
+import argparse
+import logging
+import math
+
+from sqlalchemy import select, text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from app import create_app, db
+from config import Config
+from measurement_archive import decode_block
+from models import Measurement, MeasurementBlock, PatientTrend
+from sharding import fan_out_rows
+
+logger = logging.getLogger(__name__)
+
+METRICS = ('glucose', 'systolic_bp', 'diastolic_bp', 'pulse', 'weight')
+
+# Нижняя граница разброса: у стабильного пациента дисперсия почти нулевая, и без неё любое колебание стало бы аномалией
+MIN_STD = {
+    'glucose': 0.3,
+    'systolic_bp': 4.0,
+    'diastolic_bp': 3.0,
+    'pulse': 3.0,
+    'weight': 0.5,
+}
+
+
+def new_trend(patient_id):
+    trend = PatientTrend(patient_id=patient_id)
+    for metric in METRICS:
+        setattr(trend, f'{metric}_count', 0)
+    return trend
+
+
+def score(trend, metric, value, warmup):
+    count = getattr(trend, f'{metric}_count') or 0
+    if count < warmup:
+        return None
+    std = max(math.sqrt(getattr(trend, f'{metric}_var') or 0.0), MIN_STD[metric])
+    return (value - getattr(trend, f'{metric}_mean')) / std
+
+
+def update_trend(trend, measurement, alpha, z_threshold, warmup):
+    # O(1) на измерение: экспоненциально сглаженные среднее и дисперсия по каждому показателю
+    anomalies = []
+    in_order = trend.last_measured_at is None or measurement.measured_at >= trend.last_measured_at
+    for metric in METRICS:
+        value = getattr(measurement, metric)
+        if value is None:
+            continue
+        z = score(trend, metric, value, warmup)
+        if z is not None and abs(z) > z_threshold:
+            anomalies.append({
+                'metric': metric,
+                'value': value,
+                'baseline': round(getattr(trend, f'{metric}_mean'), 2),
+                'z_score': round(z, 2)
+            })
+        # Измерения, добавленные задним числом, оцениваются, но в состояние не входят; их учтёт rebuild_trends
+        if not in_order:
+            continue
+
+        count = getattr(trend, f'{metric}_count') or 0
+        if count == 0:
+            mean, var = float(value), 0.0
+        else:
+            mean, var = getattr(trend, f'{metric}_mean'), getattr(trend, f'{metric}_var')
+            diff = value - mean
+            increment = alpha * diff
+            mean += increment
+            var = (1 - alpha) * (var + diff * increment)
+        setattr(trend, f'{metric}_count', count + 1)
+        setattr(trend, f'{metric}_mean', mean)
+        setattr(trend, f'{metric}_var', var)
+
+    if in_order:
+        trend.last_measured_at = measurement.measured_at
+    return anomalies
+
+
+def record_measurement(patient_id, measurement, config):
+    # Строка тренда создаётся или читается одним upsert: одновременные первые измерения не конфликтуют
+    # по уникальному patient_id, а взятая им блокировка записи SQLite держится до commit, так что
+    # чтение-изменение-запись состояния для разных запросов не перемешивается
+    stmt = sqlite_insert(PatientTrend).values(patient_id=patient_id, **{f'{m}_count': 0 for m in METRICS})
+    stmt = stmt.on_conflict_do_update(index_elements=[PatientTrend.patient_id],
+                                      set_={'patient_id': stmt.excluded.patient_id})
+    trend = db.session.scalars(stmt.returning(PatientTrend), execution_options={'populate_existing': True},
+                               bind_arguments={'patient_id': patient_id}).one()
+    return update_trend(trend, measurement, config['TREND_ALPHA'], config['TREND_Z_THRESHOLD'],
+                        config['TREND_WARMUP'])
+
+
+def notify_anomalies(user_id, anomalies):
+    # Вызывается после commit измерения. При шардировании уведомление лежит в общей базе, а измерение в шарде,
+    # и общей транзакции у них нет, поэтому уведомление — best effort: при сбое измерение остаётся сохранённым
+    if not anomalies:
+        return
+    message = '; '.join(f"{a['metric']}: {a['value']} (норма пациента {a['baseline']}, z={a['z_score']})"
+                        for a in anomalies)
+    try:
+        db.session.execute(
+            text("INSERT INTO notifications (user_id, type, message) VALUES (:user_id, 'warning', :message)"),
+            {'user_id': user_id, 'message': f'Отклонение от обычных значений: {message}'})
+        db.session.commit()
+    except SQLAlchemyError:
+        db.session.rollback()
+        logger.exception('Failed to store anomaly notification for user %s', user_id)
+
+
+def serialize_trend(trend):
+    if trend is None:
+        return None
+    return {
+        'last_measured_at': trend.last_measured_at.isoformat() if trend.last_measured_at else None,
+        'metrics': {metric: {
+            'samples': getattr(trend, f'{metric}_count'),
+            'mean': getattr(trend, f'{metric}_mean'),
+            'std': math.sqrt(getattr(trend, f'{metric}_var')) if getattr(trend, f'{metric}_var') is not None else None
+        } for metric in METRICS}
+    }
+
+
+def rebuild_trends(config, patient_ids=None):
+    # Полный пересчёт из истории: архивные блоки и таблица, в хронологическом порядке
+    if patient_ids is None:
+        patient_ids = sorted({pid for (pid,) in fan_out_rows(select(Measurement.patient_id).distinct())} |
+                             {pid for (pid,) in fan_out_rows(select(MeasurementBlock.patient_id).distinct())})
+
+    for patient_id in patient_ids:
+        history = []
+        for block in db.session.query(MeasurementBlock).filter_by(patient_id=patient_id):
+            history.extend(decode_block(block))
+        history.extend(db.session.query(Measurement).filter_by(patient_id=patient_id))
+        history.sort(key=lambda m: m.measured_at)
+
+        trend = db.session.query(PatientTrend).filter_by(patient_id=patient_id).first()
+        if trend is not None:
+            db.session.delete(trend)
+            db.session.flush()
+        trend = new_trend(patient_id)
+        for measurement in history:
+            update_trend(trend, measurement, config['TREND_ALPHA'], config['TREND_Z_THRESHOLD'],
+                         config['TREND_WARMUP'])
+        db.session.add(trend)
+        db.session.commit()
+        db.session.expunge_all()
+    return len(patient_ids)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Пересчёт трендов пациентов по всей истории измерений')
+    parser.add_argument('--database', help='URI базы данных (по умолчанию из Config)')
+    parser.add_argument('--patient', type=int, action='append', help='Пересчитать только этих пациентов')
+    options = parser.parse_args()
+
+    config = type('TrendConfig', (Config,), {'SQLALCHEMY_DATABASE_URI': options.database}) \
+        if options.database else Config
+    app = create_app(config)
+    with app.app_context():
+        count = rebuild_trends(app.config, options.patient)
+        print(f"Тренды пересчитаны для {count} пациентов")
+
+
+if __name__ == '__main__':
+    main()